@@ -124,3 +124,62 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# djaunty
+
+# The number of parsed search queries kept in memory by each process
+DJAUNTY_QUERY_CACHE_SIZE = 1024
+
+# How list and search results are counted: 'exact', 'estimate' (the query
+# planner's estimate) or 'cached' (an exact count cached for a while).
+# Results estimated below the threshold are always counted exactly.
+DJAUNTY_COUNT_STRATEGY = 'exact'
+DJAUNTY_COUNT_THRESHOLD = 10000
+DJAUNTY_COUNT_CACHE_TIMEOUT = 60
+
+# The cache (see CACHES) keeping facet counts until the catalog changes
+DJAUNTY_FACET_CACHE = 'default'
+DJAUNTY_FACET_CACHE_TIMEOUT = 3600
+
+# The number of datasets sampled to approximate facet counts
+DJAUNTY_FACET_SAMPLE_ROWS = 100000
+
+# The largest number of datasets accepted by a bulk create request
+DJAUNTY_INGEST_MAX_ROWS = 10000
+
+# The columns identifying a dataset when upserting, e.g. ['path'] or
+# ['identifier', 'session_id'].  They need a partial unique index, which
+# migration 0020 creates on path; another key needs a project migration
+# replacing djaunty_dataset_natural_key with an index on its columns.
+DJAUNTY_NATURAL_KEY = ['path']
+
+# The largest number of datasets a data tag query may match
+DJAUNTY_DATATAG_MAX_DATASETS = 1000000
+
+# The number of background job worker processes started by run_workers,
+# and how often idle workers look for new jobs in seconds
+DJAUNTY_JOB_WORKERS = 2
+DJAUNTY_JOB_POLL_INTERVAL = 1.0
+
+# The number of seconds a worker holds a job without renewing its lease,
+# after which the job is claimed again, up to a number of attempts
+DJAUNTY_JOB_LEASE = 60
+DJAUNTY_JOB_MAX_ATTEMPTS = 3
+
+# The number of rows read from the database at a time by the dataset export
+DJAUNTY_EXPORT_CHUNK_SIZE = 2000
+
+# Where exports run in the background are written, a directory shared by
+# the web and run_workers processes
+DJAUNTY_EXPORT_ROOT = os.path.join(BASE_DIR, 'exports')
+
+# The number of encoded dataset representations kept in memory by each
+# process, for list and detail responses
+DJAUNTY_ROW_CACHE_SIZE = 10000
+
+# The largest number of changes returned by one request to the change feed
+DJAUNTY_CHANGES_PAGE_SIZE = 1000
+
+# The number of datasets changed per transaction by bulk updates and deletes
+DJAUNTY_BULK_CHUNK_SIZE = 1000
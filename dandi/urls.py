@@ -18,7 +18,7 @@ import debug_toolbar
 from django.contrib import admin
 from django.urls import include, path
 
-from djaunty.api import DataTagViewSet, DatasetViewSet
+from djaunty.api import DataTagViewSet, DatasetViewSet, JobViewSet
 from djaunty.views import dataset, search, text_search, tree
 
 from rest_framework import routers
@@ -27,6 +27,7 @@ from rest_framework import routers
 router = routers.DefaultRouter()
 router.register('datasets', DatasetViewSet)
 router.register('datatags', DataTagViewSet)
+router.register('jobs', JobViewSet)
 
 urlpatterns = [
     path('__debug__', include(debug_toolbar.urls)),
@@ -1,20 +1,68 @@
+from contextlib import contextmanager
+
+from django.db import IntegrityError, transaction
 from django.db.models import Count
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 
-from rest_framework import viewsets
+from rest_framework import exceptions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.filters import OrderingFilter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
 
+from .bulk import bulk_delete, bulk_update
+from .catalog import catalog_version
+from .changes import CHANGES_PAGE_SIZE, ChangesPruned, latest_cursor, read_changes
+from .conditional import make_etag, not_modified, set_validators
+from .datatags import DataTagTooLarge, refresh_datatag
+from .export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, EXPORT_PARAMS, export_lines, export_storage
+from .facets import COUNTED_FACETS, counted_facet_counts, facet_cache, facet_counts, \
+    facet_name, facet_request_key, histogram_counts, sample_percentage
 from .filters import ComplexSearchFilter, TextSearchFilter
-from .models import DataTag, Dataset
+from .ingest import INGEST_MAX_ROWS, KEY_TAKEN, NATURAL_KEY, NATURAL_KEY_INDEX, ingest_rows, \
+    upsert_datasets, validate_rows
+from .jobs import bulk_request, enqueue
+from .models import DataTag, Dataset, FacetCount, Job
+from .pagination import DatasetPagination
+from .representation import dataset_representation, dataset_values, select_fields
+from .rowcache import dataset_fragments, splice
+from .search_parser import Histogram
 from .serializers import DataTagListSerializer, DataTagSerializer, \
-    DatasetFacetSerializer, DatasetSerializer
+    DatasetChangeSerializer, DatasetFacetSerializer, DatasetSerializer, JobSerializer
+
+
+def run_in_background(request):
+    """Whether the request asks for a job (``?background=true``) instead of waiting for the result."""
+    return request.query_params.get('background', '').lower() in ('1', 'true', 'yes')
+
+
+def accepted(request, job, **data):
+    return Response({
+        'job': job.pk,
+        'url': reverse('job-detail', args=[job.pk], request=request),
+        **data
+    }, status=status.HTTP_202_ACCEPTED)
 
 
-class DatasetPagination(PageNumberPagination):
-    page_size = 25
-    max_page_size = 100
-    page_size_query_param = 'page_size'
+def check_row_count(data):
+    if len(data) > INGEST_MAX_ROWS:
+        detail = f'At most {INGEST_MAX_ROWS} datasets can be written at once'
+        raise exceptions.ValidationError(detail=detail)
+
+
+@contextmanager
+def key_conflicts():
+    """Turn a write taking an existing natural key into a validation error."""
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as e:
+        diag = getattr(e.__cause__, 'diag', None)
+        if diag is None or diag.constraint_name != NATURAL_KEY_INDEX:
+            raise
+        raise exceptions.ValidationError(detail={column: [KEY_TAKEN] for column in NATURAL_KEY})
 
 
 class DatasetViewSet(viewsets.ModelViewSet):
@@ -23,8 +71,216 @@ class DatasetViewSet(viewsets.ModelViewSet):
     pagination_class = DatasetPagination
     filter_backends = [TextSearchFilter, ComplexSearchFilter, OrderingFilter]
 
+    def get_fields(self):
+        """The fields selected with ``?fields=`` and ``?exclude=``, comma separated."""
+        def names(param):
+            value = self.request.query_params.get(param)
+            return [name.strip() for name in value.split(',') if name.strip()] if value else None
+
+        try:
+            return select_fields(names('fields'), names('exclude'))
+        except ValueError as e:
+            raise exceptions.ValidationError(detail=str(e))
+
+    def list(self, request, *args, **kwargs):
+        # any committed change to the catalog moves its version, there's
+        # none to validate against while changes are being written
+        version = catalog_version()
+        etag = None if version is None else make_etag(
+            'datasets', version, request.get_full_path(), request.accepted_renderer.format
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        fields = self.get_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        if not self.renders_json(request):
+            queryset = dataset_values(queryset, fields)
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                response = self.get_paginated_response([dataset_representation(row, fields) for row in page])
+            else:
+                response = Response([dataset_representation(row, fields) for row in queryset])
+            return set_validators(response, etag)
+
+        # page through ids and updated times only, the rows come from the row cache
+        queryset = dataset_values(queryset, ['id', 'updated'])
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            body = splice(self.get_paginated_response([]).data, dataset_fragments(page, fields))
+        else:
+            body = b'[' + b','.join(dataset_fragments(queryset, fields)) + b']'
+        return set_validators(HttpResponse(body, content_type='application/json'), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+
+        pk, updated = get_object_or_404(queryset.values_list('id', 'updated'), **lookup)
+        etag = make_etag(
+            'dataset', self.kwargs[lookup_url_kwarg], updated.isoformat(),
+            ','.join(fields), request.accepted_renderer.format
+        )
+        response = not_modified(request, etag, updated)
+        if response is not None:
+            return response
+
+        if self.renders_json(request):
+            fragments = dataset_fragments([{'id': pk, 'updated': updated}], fields)
+            if not fragments:
+                raise Http404
+            response = HttpResponse(fragments[0], content_type='application/json')
+        else:
+            row = get_object_or_404(dataset_values(queryset, fields), **lookup)
+            response = Response(dataset_representation(row, fields))
+        return set_validators(response, etag, updated)
+
+    def renders_json(self, request):
+        """Whether the response is plain JSON, which can be spliced from cached fragments."""
+        return type(request.accepted_renderer) is JSONRenderer
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+
+        # a list of datasets is ingested in bulk, skipping the invalid ones
+        check_row_count(request.data)
+        if run_in_background(request):
+            return accepted(request, enqueue('ingest_datasets', rows=request.data))
+
+        ids, errors = ingest_rows(request.data)
+        return Response({
+            'created': len(ids),
+            'ids': ids,
+            'errors': errors
+        }, status=status.HTTP_201_CREATED if ids or not errors else status.HTTP_400_BAD_REQUEST)
+
+    def perform_create(self, serializer):
+        with key_conflicts():
+            super().perform_create(serializer)
+
+    def perform_update(self, serializer):
+        with key_conflicts():
+            super().perform_update(serializer)
+
+    @action(detail=False, methods=['POST', 'PUT'])
+    def upsert(self, request, *args, **kwargs):
+        """Create or replace datasets identified by their natural key (``DJAUNTY_NATURAL_KEY``)."""
+        data = request.data if isinstance(request.data, list) else [request.data]
+        check_row_count(data)
+        if run_in_background(request):
+            return accepted(request, enqueue('upsert_datasets', rows=data))
+
+        rows, errors = validate_rows(data, require_key=True)
+        created, updated, unchanged = upsert_datasets(rows)
+        return Response({
+            'created': created,
+            'updated': updated,
+            'unchanged': unchanged,
+            'errors': errors
+        }, status=status.HTTP_200_OK if rows or not errors else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['POST'])
+    def bulk_update(self, request, *args, **kwargs):
+        """Apply a ``patch`` to every dataset matching ``query``, a chunk at a time.
+
+        With ``dry_run`` only the number of matching datasets is returned.
+        """
+        data = bulk_request(request.data, require_patch=True)
+        if data['dry_run']:
+            return Response({'matched': Dataset.objects.filter(data['query']).count(), 'dry_run': True})
+        if run_in_background(request):
+            return accepted(request, enqueue('bulk_update', data=request.data))
+
+        return Response({'updated': bulk_update(data['query'], data['patch'])})
+
+    @action(detail=False, methods=['POST'])
+    def bulk_delete(self, request, *args, **kwargs):
+        """Delete every dataset matching ``query`` with its links, a chunk at a time.
+
+        With ``dry_run`` only the number of matching datasets is returned.
+        """
+        data = bulk_request(request.data)
+        if data['dry_run']:
+            return Response({'matched': Dataset.objects.filter(data['query']).count(), 'dry_run': True})
+        if run_in_background(request):
+            return accepted(request, enqueue('bulk_delete', data=request.data))
+
+        deleted = bulk_delete(data['query'])
+        return Response({'deleted': deleted.get(Dataset._meta.label, 0), 'links': deleted})
+
+    @action(detail=False, methods=['GET'])
+    def export(self, request, *args, **kwargs):
+        """Stream every dataset matching the search and query as NDJSON or CSV (``?output=csv``).
+
+        In the background (``?background=true``) the export is written by a
+        job and downloaded from it once it succeeded, in the order of ids.
+        """
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            detail = f'Unknown output "{export_format}", choose one of {", ".join(EXPORT_FORMATS)}'
+            raise exceptions.ValidationError(detail=detail)
+
+        fields = self.get_fields()
+        if run_in_background(request):
+            params = {
+                name: request.query_params[name] for name in EXPORT_PARAMS if name in request.query_params
+            }
+            job = enqueue('export_datasets', params=params, fields=fields, output=export_format)
+            return accepted(request, job, download=reverse('job-download', args=[job.pk], request=request))
+
+        # iterator() reads through a server-side cursor, a chunk at a time
+        queryset = dataset_values(self.filter_queryset(self.get_queryset()), fields)
+        rows = (
+            dataset_representation(row, fields)
+            for row in queryset.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+
+        response = StreamingHttpResponse(
+            export_lines(rows, export_format, fields),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="datasets.{export_format}"'
+        return response
+
+    @action(detail=False, methods=['POST'])
+    def reindex(self, request, *args, **kwargs):
+        """Rebuild every search vector in the background, e.g. after changing how they are built."""
+        return accepted(request, enqueue('reindex_search'))
+
+    @action(detail=False, methods=['GET'])
+    def changes(self, request, *args, **kwargs):
+        """Changes to datasets and their links after ``?since=<cursor>``, oldest first.
+
+        ``?since=latest`` returns no changes, only a cursor to follow the feed from now on.
+        """
+        since = request.query_params.get('since')
+        if since == 'latest':
+            return Response({'results': [], 'next': latest_cursor(), 'more': False})
+
+        try:
+            limit = min(int(request.query_params.get('limit', CHANGES_PAGE_SIZE)), CHANGES_PAGE_SIZE)
+            changes, cursor, more = read_changes(since, max(limit, 1))
+        except ValueError:
+            raise exceptions.ValidationError(detail='Invalid since cursor or limit')
+        except ChangesPruned as e:
+            return Response({'detail': str(e)}, status=status.HTTP_410_GONE)
+
+        return Response({
+            'results': DatasetChangeSerializer(changes, many=True).data,
+            'next': cursor,
+            'more': more
+        })
+
     @action(detail=False, methods=['POST'])
     def facet(self, request, *args, **kwargs):
+        # counts aren't model rows, they are paged by number only
+        if DatasetPagination.cursor_query_param in request.query_params:
+            raise exceptions.ValidationError(detail='Facet counts are paged by page number, not by cursor')
+
         serializer = DatasetFacetSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
@@ -34,12 +290,57 @@ class DatasetViewSet(viewsets.ModelViewSet):
         if 'query' in data:
             qs = qs.filter(data['query'])
 
+        key = facet_request_key(data)
+
+        # unfiltered counts of the most used facets are kept up to date
+        counted = not data.get('query') and not data.get('path')
+
+        def count(facets, path):
+            sample = sample_percentage() if data.get('approximate') else None
+            return facet_counts(qs, facets, path, sample=sample)
+
+        if 'facet' not in data:
+            facets = data.get('facets', [])
+            if counted and all(facet_name(facet) in COUNTED_FACETS for facet in facets):
+                results = counted_facet_counts(facets, data.get('approximate'))
+            else:
+                results = facet_cache.get_or_compute(key, lambda: count(facets, data.get('path', [])))
+            return Response({'count': len(results), 'results': results})
+
+        if isinstance(data['facet'], Histogram):
+            results = facet_cache.get_or_compute(key, lambda: histogram_counts(qs, data['facet']))
+            return Response({'count': len(results), 'results': results})
+
+        if counted and facet_name(data['facet']) in COUNTED_FACETS:
+            values = FacetCount.objects.filter(facet=facet_name(data['facet']), count__gt=0)
+            values = values.order_by('-count', 'value').values_list('value', 'count')
+            page = self.paginate_queryset(values)
+            # exact counts, with the error approximate counts come with
+            error = {'error': 0} if data.get('approximate') else {}
+            return self.get_paginated_response([
+                {'facet': value, 'count': count, **error} for value, count in page
+            ])
+
+        if data.get('approximate'):
+            name = facet_name(data['facet'])
+            results = facet_cache.get_or_compute(key, lambda: count([data['facet']], []))
+            page = self.paginate_queryset(results)
+            return self.get_paginated_response([
+                {'facet': result['facets'][name], 'count': result['count'], 'error': result['error']}
+                for result in page
+            ])
+
         qs = qs.annotate(facet=data['facet'])
 
         values = qs.values('facet').annotate(count=Count('facet')).filter(count__gt=0).order_by('-count')
+        values = facet_cache.get_or_compute(key, lambda: list(values))
         page = self.paginate_queryset(values)
         return self.get_paginated_response(page)
 
+    @action(detail=False, methods=['GET'], url_path='facet/stats')
+    def facet_stats(self, request, *args, **kwargs):
+        return Response(facet_cache.stats())
+
 
 class DataTagViewSet(viewsets.ModelViewSet):
     queryset = DataTag.objects.all().order_by('id')
@@ -51,3 +352,90 @@ class DataTagViewSet(viewsets.ModelViewSet):
             return DataTagListSerializer
 
         return DataTagSerializer
+
+    def retrieve(self, request, *args, **kwargs):
+        datatag = self.get_object()
+
+        # membership also changes when tagged datasets are deleted
+        last_modified = max(filter(None, [datatag.updated, datatag.last_refreshed]))
+        version = catalog_version()
+        etag = None if version is None else make_etag(
+            'datatag', datatag.pk, datatag.updated.isoformat(), datatag.last_refreshed,
+            version, request.accepted_renderer.format
+        )
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        return set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+
+    def get_serializer_context(self):
+        # membership is computed by a job for background requests
+        return dict(super().get_serializer_context(), defer_refresh=run_in_background(self.request))
+
+    # the job refreshing the membership of a tag saved by this request
+    refresh_job = None
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.enqueue_refresh(serializer)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.enqueue_refresh(serializer)
+
+    def enqueue_refresh(self, serializer):
+        if run_in_background(self.request) and serializer.needs_refresh:
+            self.refresh_job = enqueue('refresh_datatag', datatag=serializer.instance.pk)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        if self.refresh_job is None:
+            return response
+        return accepted(request, self.refresh_job, datatag=response.data)
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        if self.refresh_job is None:
+            return response
+        return accepted(request, self.refresh_job, datatag=response.data)
+
+    @action(detail=True, methods=['POST'])
+    def refresh(self, request, *args, **kwargs):
+        """Re-run the stored query of the tag over every dataset."""
+        datatag = self.get_object()
+        if datatag.query is None:
+            raise exceptions.ValidationError(detail='This tag has no stored query to refresh')
+
+        if run_in_background(request):
+            return accepted(request, enqueue('refresh_datatag', datatag=datatag.pk))
+
+        try:
+            added, removed = refresh_datatag(datatag)
+        except DataTagTooLarge as e:
+            raise exceptions.ValidationError(detail=str(e))
+        return Response({
+            'added': added,
+            'removed': removed,
+            'last_refreshed': datatag.last_refreshed
+        })
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Job.objects.all().order_by('-id')
+    serializer_class = JobSerializer
+    pagination_class = DatasetPagination
+
+    @action(detail=True, methods=['GET'])
+    def download(self, request, *args, **kwargs):
+        """The file written by a succeeded export job."""
+        job = self.get_object()
+        result = job.result or {}
+        if job.status != Job.SUCCEEDED or 'file' not in result or not export_storage.exists(result['file']):
+            raise Http404('The job has no file to download')
+        return FileResponse(
+            export_storage.open(result['file'], 'rb'),
+            as_attachment=True,
+            filename=result['file'],
+            content_type=EXPORT_FORMATS[result['output']]
+        )
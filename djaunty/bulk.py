@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.db import transaction
+
+from .ingest import resolve, sync_links
+from .models import Dataset, Keyword, Publication
+
+# The number of datasets changed per transaction by bulk updates and deletes
+BULK_CHUNK_SIZE = getattr(settings, 'DJAUNTY_BULK_CHUNK_SIZE', 1000)
+
+
+def chunks(query, chunk_size):
+    """Yield the ids of the datasets matching the query, a chunk at a time, in id order.
+
+    Each chunk is read after the previous one was written, seeking past
+    its last id, so rows changed by earlier chunks are never revisited.
+    """
+    last = 0
+    while True:
+        ids = list(
+            Dataset.objects.filter(query).filter(pk__gt=last)
+            .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def bulk_update(query, patch, chunk_size=BULK_CHUNK_SIZE, progress=None):
+    """Apply a patch of validated DatasetSerializer data to the datasets matching the query.
+
+    Keywords and related publications in the patch replace those of the
+    datasets.  Every chunk is one UPDATE (plus the link changes) in its own
+    transaction, so locks are held briefly.  Returns the number of datasets
+    updated.
+    """
+    patch = dict(patch)
+    keywords = patch.pop('keywords', None)
+    dois = patch.pop('related_publications', None)
+    keyword_ids = publication_ids = None
+    if keywords is not None:
+        resolved = resolve(Keyword, 'keyword', keywords)
+        keyword_ids = [resolved[keyword] for keyword in dict.fromkeys(keywords)]
+    if dois is not None:
+        resolved = resolve(Publication, 'doi', dois)
+        publication_ids = [resolved[doi] for doi in dict.fromkeys(dois)]
+
+    updated = 0
+    for ids in chunks(query, chunk_size):
+        with transaction.atomic():
+            if patch:
+                Dataset.objects.filter(pk__in=ids).update(**patch)
+            if keyword_ids is not None:
+                sync_links(Dataset.keywords.field, dict.fromkeys(ids, keyword_ids))
+            if publication_ids is not None:
+                sync_links(Dataset.related_publications.field, dict.fromkeys(ids, publication_ids))
+
+        updated += len(ids)
+        if progress is not None:
+            progress(updated)
+    return updated
+
+
+def bulk_delete(query, chunk_size=BULK_CHUNK_SIZE, progress=None):
+    """Delete the datasets matching the query, with their keyword, publication and tag links.
+
+    Returns the number of rows deleted per model, like ``QuerySet.delete``.
+    """
+    deleted = {}
+    for ids in chunks(query, chunk_size):
+        # only the ids are loaded, the links go in one DELETE per table
+        with transaction.atomic():
+            _, counts = Dataset.objects.filter(pk__in=ids).only('pk').delete()
+
+        for model, count in counts.items():
+            deleted[model] = deleted.get(model, 0) + count
+        if progress is not None:
+            progress(deleted.get(Dataset._meta.label, 0))
+    return deleted
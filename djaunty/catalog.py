@@ -0,0 +1,26 @@
+from django.db import connections
+
+
+def catalog_version(using='default'):
+    """Return a number that changes whenever a change to the catalog is committed.
+
+    It is bumped by triggers on the dataset, keyword and publication
+    tables and their links, once per writing transaction, see migration
+    0029.  While a writing transaction is in flight the version may
+    already stand for changes that aren't visible yet, so None is
+    returned and nothing should be cached under a version.
+    """
+    with connections[using].cursor() as cursor:
+        # the version first: a writer locks before bumping it, so a bump
+        # read here is either committed or its lock is seen below
+        cursor.execute('SELECT last_value FROM djaunty_catalog_version')
+        version = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_locks
+                WHERE locktype = 'advisory' AND classid = 'djaunty_catalog_version'::regclass
+                    AND objid = 0 AND objsubid = 2
+            )
+        """)
+        writing = cursor.fetchone()[0]
+    return None if writing else version
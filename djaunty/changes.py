@@ -0,0 +1,100 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import DatasetChange, DatasetChangePrune
+
+# The largest number of changes returned at once by the change feed
+CHANGES_PAGE_SIZE = getattr(settings, 'DJAUNTY_CHANGES_PAGE_SIZE', 1000)
+
+# the largest bigint, for a cursor past every change of a transaction
+MAX_ID = 2 ** 63 - 1
+
+
+def encode_cursor(txid, id):
+    return base64.urlsafe_b64encode(f'{txid}:{id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (txid, id) of a cursor, raising ValueError for invalid ones."""
+    try:
+        txid, id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(txid), int(id)
+    except (TypeError, UnicodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+
+
+def horizon():
+    """The oldest transaction still running, every change before it is committed (or gone)."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0]
+
+
+def latest_cursor():
+    """A cursor past every change committed so far, to start following the feed."""
+    return encode_cursor(horizon() - 1, MAX_ID)
+
+
+class ChangesPruned(Exception):
+    pass
+
+
+def pruned_through():
+    """The (txid, id) of the last change deleted by ``prune_changes``, or None."""
+    last = DatasetChangePrune.objects.order_by('-txid', '-change_id').values_list('txid', 'change_id').first()
+    return None if last is None else tuple(last)
+
+
+def prune_changes(before):
+    """Delete the changes committed before the given time, returning how many were deleted.
+
+    Only whole leading stretches of the feed are deleted, the position of
+    the last deleted change is kept so cursors before it are refused.
+    """
+    with transaction.atomic():
+        last = DatasetChange.objects.filter(created__lt=before, txid__lt=horizon()) \
+            .order_by('-txid', '-id').values_list('txid', 'id').first()
+        if last is None:
+            return 0
+
+        txid, id = last
+        deleted, _ = DatasetChange.objects.filter(Q(txid__lt=txid) | Q(txid=txid, id__lte=id)).delete()
+        DatasetChangePrune.objects.create(txid=txid, change_id=id)
+    return deleted
+
+
+def read_changes(since=None, limit=CHANGES_PAGE_SIZE):
+    """Return up to ``limit`` changes after the ``since`` cursor, the next cursor and whether there are more.
+
+    Changes are ordered by writing transaction, not by commit.  Only
+    transactions older than every running one are read, so a transaction
+    committing after a later one can't land before a cursor that was
+    handed out.  The next cursor is past every change read, or past every
+    committed change once there are no more.  Without a cursor the feed
+    is read from its oldest kept change, cursors before changes deleted by
+    ``prune_changes`` raise ChangesPruned.
+    """
+    start = None if since is None else decode_cursor(since)
+    pruned = pruned_through()
+    if start is not None and pruned is not None and start < pruned:
+        raise ChangesPruned('Changes after this cursor were pruned, follow the feed from since=latest')
+
+    limit_txid = horizon()
+    changes = DatasetChange.objects.filter(txid__lt=limit_txid).order_by('txid', 'id')
+    if start is not None:
+        txid, id = start
+        changes = changes.filter(txid__gte=txid).exclude(txid=txid, id__lte=id)
+
+    changes = list(changes[:limit + 1])
+    more = len(changes) > limit
+    changes = changes[:limit]
+
+    if more:
+        position = (changes[-1].txid, changes[-1].id)
+    else:
+        position = max(filter(None, [start, (limit_txid - 1, MAX_ID)]))
+    return changes, encode_cursor(*position), more
@@ -0,0 +1,39 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """A strong ETag for a representation identified by the parts."""
+    return quote_etag(hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def set_validators(response, etag, last_modified=None):
+    """Set the ETag and Last-Modified headers, or none without an ETag (see ``catalog_version``)."""
+    if etag is None:
+        return response
+
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """Return a 304 (or 412) response when the client's copy is current, or None.
+
+    Call it before building the response body, that is the work it saves.
+    Without an ETag the request is always answered in full.
+    """
+    if etag is None:
+        return None
+
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=None if last_modified is None else int(last_modified.timestamp())
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
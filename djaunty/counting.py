@@ -0,0 +1,75 @@
+from hashlib import md5
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+# One of 'exact', 'estimate' or 'cached'.  Above COUNT_THRESHOLD the
+# non-exact strategies report the planner's estimate or an exact count
+# cached for COUNT_CACHE_TIMEOUT seconds.
+COUNT_STRATEGY = getattr(settings, 'DJAUNTY_COUNT_STRATEGY', 'exact')
+COUNT_THRESHOLD = getattr(settings, 'DJAUNTY_COUNT_THRESHOLD', 10000)
+COUNT_CACHE_TIMEOUT = getattr(settings, 'DJAUNTY_COUNT_CACHE_TIMEOUT', 60)
+
+COUNT_STRATEGIES = ['exact', 'estimate', 'cached']
+
+
+def estimate_count(queryset):
+    """Return the number of rows the query planner expects the queryset to return."""
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_queryset(queryset, strategy=None):
+    """Count the queryset according to the strategy.
+
+    Returns a tuple of the count and whether that count is exact.  Small
+    results are always counted exactly.
+    """
+    strategy = strategy or COUNT_STRATEGY
+    if not isinstance(queryset, QuerySet):
+        return len(queryset), True
+
+    if strategy == 'exact':
+        return queryset.count(), True
+
+    estimate = estimate_count(queryset)
+    if estimate <= COUNT_THRESHOLD:
+        return queryset.count(), True
+
+    if strategy == 'estimate':
+        return estimate, False
+
+    sql, params = queryset.query.sql_with_params()
+    key = 'djaunty:count:' + md5(repr((sql, params)).encode()).hexdigest()
+    count = cache.get(key)
+    if count is not None:
+        return count, False
+
+    count = queryset.count()
+    cache.set(key, count, COUNT_CACHE_TIMEOUT)
+    return count, True
+
+
+class CountingPaginator(Paginator):
+    """A paginator counting its object list with one of the count strategies."""
+
+    def __init__(self, *args, count_strategy=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy
+        self.count_exact = True
+
+    @cached_property
+    def count(self):
+        count, self.count_exact = count_queryset(self.object_list, self.count_strategy)
+        return count
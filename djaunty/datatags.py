@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import DataTag, Dataset
+from .search_parser import search_parsers
+
+# The largest number of datasets a single tag query may match
+DATATAG_MAX_DATASETS = getattr(settings, 'DJAUNTY_DATATAG_MAX_DATASETS', 1000000)
+
+
+TOO_MANY_DATASETS = f'The query matches more than {DATATAG_MAX_DATASETS} datasets'
+
+
+class DataTagTooLarge(Exception):
+    pass
+
+
+def too_many_datasets(query):
+    """Whether the query matches more datasets than a tag may hold, counting at most one more."""
+    return Dataset.objects.filter(query)[:DATATAG_MAX_DATASETS + 1].count() > DATATAG_MAX_DATASETS
+
+
+def too_many_tagged(datatag):
+    """Whether the tag holds more datasets than it may, counting at most one more."""
+    tagged = DataTag.datasets.through.objects.filter(datatag_id=datatag.pk)
+    return tagged[:DATATAG_MAX_DATASETS + 1].count() > DATATAG_MAX_DATASETS
+
+
+def tag_datasets(datatag, query, datasets=None):
+    """Make the datasets matching the query exactly the datasets of the tag.
+
+    The delta is computed in the database, only the links that change are
+    deleted or inserted and no ids are loaded into Python.  When a list of
+    dataset ids is given, only the membership of those is re-evaluated.
+    Returns the number of datasets added and removed.
+    """
+    through = DataTag.datasets.through
+    table = connection.ops.quote_name(through._meta.db_table)
+
+    matched = Dataset.objects.filter(query)
+    scope = ''
+    scope_params = []
+    if datasets is not None:
+        matched = matched.filter(pk__in=datasets)
+        scope = 'AND link.dataset_id = ANY(%s)'
+        scope_params = [list(datasets)]
+    matched, params = matched.order_by().values('pk').query.sql_with_params()
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"""
+            DELETE FROM {table} AS link
+            WHERE link.datatag_id = %s {scope} AND NOT EXISTS (
+                SELECT 1 FROM ({matched}) AS matched (id) WHERE matched.id = link.dataset_id
+            )
+        """, [datatag.pk, *scope_params, *params])
+        removed = cursor.rowcount
+
+        cursor.execute(f"""
+            INSERT INTO {table} (datatag_id, dataset_id)
+            SELECT %s, matched.id FROM ({matched}) AS matched (id)
+            ON CONFLICT DO NOTHING
+        """, [datatag.pk, *params])
+        added = cursor.rowcount
+
+    return added, removed
+
+
+def refresh_datatag(datatag):
+    """Re-run the stored query of a tag over every dataset.
+
+    Raises DataTagTooLarge, and records it on the tag, when the query
+    matches more than ``DATATAG_MAX_DATASETS`` datasets.  The membership
+    is left as it was then.
+    """
+    query = search_parsers.parse(datatag.query)
+    if too_many_datasets(query):
+        datatag.refresh_error = TOO_MANY_DATASETS
+        DataTag.objects.filter(pk=datatag.pk).update(refresh_error=datatag.refresh_error)
+        raise DataTagTooLarge(TOO_MANY_DATASETS)
+
+    with transaction.atomic():
+        added, removed = tag_datasets(datatag, query)
+        datatag.last_refreshed = timezone.now()
+        datatag.refresh_error = None
+        DataTag.objects.filter(pk=datatag.pk).update(last_refreshed=datatag.last_refreshed, refresh_error=None)
+
+    return added, removed
+
+
+def refresh_changed_datasets(batch_size=1000):
+    """Re-evaluate a batch of queued, changed datasets against every live tag.
+
+    Batches locked by concurrent workers are skipped.  A tag that would
+    outgrow ``DATATAG_MAX_DATASETS`` keeps its membership, stops being
+    live and records why.  Returns the number of datasets taken off the
+    queue.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM djaunty_datatagqueue
+                WHERE dataset_id IN (
+                    SELECT dataset_id FROM djaunty_datatagqueue
+                    ORDER BY dataset_id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING dataset_id
+            """, [batch_size])
+            datasets = [row[0] for row in cursor.fetchall()]
+
+        if not datasets:
+            return 0
+
+        refreshed = []
+        for datatag in DataTag.objects.filter(live=True, query__isnull=False):
+            try:
+                with transaction.atomic():
+                    added, removed = tag_datasets(datatag, search_parsers.parse(datatag.query), datasets)
+                    # only a tag that grew can have outgrown the limit
+                    if added > removed and too_many_tagged(datatag):
+                        raise DataTagTooLarge(TOO_MANY_DATASETS)
+            except DataTagTooLarge as e:
+                DataTag.objects.filter(pk=datatag.pk).update(live=False, refresh_error=str(e))
+            else:
+                refreshed.append(datatag.pk)
+        DataTag.objects.filter(pk__in=refreshed).update(last_refreshed=timezone.now())
+
+    return len(datasets)
@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+from rest_framework.utils.encoders import JSONEncoder
+
+# The number of rows fetched from the server-side cursor at a time
+EXPORT_CHUNK_SIZE = getattr(settings, 'DJAUNTY_EXPORT_CHUNK_SIZE', 2000)
+
+# Where background exports are written, the workers and the web processes
+# must share it
+EXPORT_ROOT = getattr(settings, 'DJAUNTY_EXPORT_ROOT', os.path.join(settings.BASE_DIR, 'exports'))
+
+# The query parameters selecting the exported datasets
+EXPORT_PARAMS = ['search', 'rank', 'query']
+
+export_storage = FileSystemStorage(location=EXPORT_ROOT)
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class Echo:
+    """A file-like object returning what is written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_lines(rows):
+    encoder = JSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def csv_lines(rows, fields):
+    """Render rows as CSV, joining list values with semicolons."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([
+            ';'.join(value) if isinstance(value, list) else value
+            for value in (row[field] for field in fields)
+        ])
+
+
+def export_lines(rows, export_format, fields):
+    if export_format == 'csv':
+        return csv_lines(rows, fields)
+    return ndjson_lines(rows)
+
+
+def write_export(name, lines):
+    """Write the lines of an export to the export storage, replacing it at once when complete."""
+    path = export_storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', newline='') as f:
+        f.writelines(lines)
+    os.replace(path + '.tmp', path)
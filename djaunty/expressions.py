@@ -0,0 +1,43 @@
+from django.contrib.postgres.fields import ArrayField
+from django.db.models import CharField, Subquery
+from django.db.models.sql.datastructures import BaseTable
+
+
+class ArraySubquery(Subquery):
+    """Collect the single column returned by a subquery into an array."""
+
+    template = 'ARRAY(%(subquery)s)'
+
+    def __init__(self, queryset, output_field=None, **extra):
+        if output_field is None:
+            output_field = ArrayField(CharField())
+        super().__init__(queryset, output_field=output_field, **extra)
+
+
+class SampledTable(BaseTable):
+    """The base table of a query read through a block sample (TABLESAMPLE SYSTEM).
+
+    Only the sampled pages are read, each with the given percentage as its
+    probability.
+    """
+
+    def __init__(self, table, percentage):
+        super().__init__(table.table_name, table.table_alias)
+        self.percentage = percentage
+
+    def as_sql(self, compiler, connection):
+        sql, params = super().as_sql(compiler, connection)
+        return f'{sql} TABLESAMPLE SYSTEM (%s)', [*params, self.percentage]
+
+    @property
+    def identity(self):
+        return (*super().identity, self.percentage)
+
+
+def sample_table(queryset, percentage):
+    """Return the queryset reading a block sample of its base table."""
+    queryset = queryset.all()
+    query = queryset.query
+    alias = query.get_initial_alias()
+    query.alias_map[alias] = SampledTable(query.alias_map[alias], percentage)
+    return queryset
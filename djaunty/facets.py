@@ -0,0 +1,341 @@
+from datetime import datetime, timedelta, timezone
+from hashlib import md5
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import Count
+from django.db.models.expressions import RawSQL
+from django.utils.duration import duration_string
+
+from .catalog import catalog_version
+from .expressions import sample_table
+from .models import Dataset, FacetCount
+from .search_parser import BaseParser, facet_parsers, search_parsers
+
+ATTRIBUTE_NAMES = {column: name for name, column in BaseParser.aliases.items()}
+
+# Facets with unfiltered counts kept in FacetCount, and the column counted
+COUNTED_FACETS = {
+    'lab': 'lab',
+    'institution': 'institution',
+    'species': 'species',
+    'experimenter': 'experimenter',
+    'keyword': 'keywords__keyword'
+}
+
+# The alias of the Django cache holding facet counts, point it at a shared
+# backend (e.g. memcached) so that every worker process benefits.
+FACET_CACHE = getattr(settings, 'DJAUNTY_FACET_CACHE', 'default')
+FACET_CACHE_TIMEOUT = getattr(settings, 'DJAUNTY_FACET_CACHE_TIMEOUT', 3600)
+
+# The number of dataset rows sampled for approximate facet counts
+FACET_SAMPLE_ROWS = getattr(settings, 'DJAUNTY_FACET_SAMPLE_ROWS', 100000)
+
+
+def facet_name(expression):
+    """Return the attribute name a client uses for a parsed facet."""
+    return ATTRIBUTE_NAMES.get(expression.name, expression.name)
+
+
+def grouping_sets(facets, path):
+    """Return the column indices of every grouping set.
+
+    Every facet is counted on its own, and every prefix of the path is
+    counted as a level of nested facets.
+    """
+    sets = [(i,) for i in range(len(facets))]
+    for depth in range(1, len(path) + 1):
+        sets.append(tuple(range(len(facets), len(facets) + depth)))
+    return list(dict.fromkeys(sets))
+
+
+def sample_percentage(rows=FACET_SAMPLE_ROWS, using='default'):
+    """Return the percentage of the dataset table holding about that many rows."""
+    with connections[using].cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [Dataset._meta.db_table])
+        total = cursor.fetchone()[0]
+
+    if total <= rows:  # includes -1, for never analyzed tables
+        return 100
+    return 100 * rows / total
+
+
+def facet_counts(queryset, facets=(), path=(), sample=None):
+    """Count the datasets of several facets and facet path levels in one statement.
+
+    Returns a list of ``{'facets': {name: value, ...}, 'count': count}``
+    ordered by grouping set and then by decreasing count.  Buckets with
+    a null value are left out.
+
+    With a ``sample`` percentage below 100, only a block sample of the
+    dataset table is read (TABLESAMPLE SYSTEM), the counts are extrapolated
+    from it and every bucket gets an ``error``, the half width of a 95%
+    confidence interval of its count.  Pages rather than datasets are
+    sampled, and datasets written together share pages, so the error is
+    estimated from the counts per sampled page: the variance of the
+    extrapolated count is (1 - f) / f^2 times the sum of their squares.
+    """
+    expressions = list(facets) + list(path)
+    aliases = [f'facet_{i}' for i in range(len(expressions))]
+    names = [facet_name(expression) for expression in expressions]
+    connection = connections[queryset.db]
+    columns = ', '.join(aliases)
+
+    if sample is not None and sample < 100:
+        fraction = sample / 100
+        table = connection.ops.quote_name(Dataset._meta.db_table)
+        inner = sample_table(queryset, sample).order_by().annotate(
+            page=RawSQL(f'({table}.ctid::text::point)[0]', []),
+            **dict(zip(aliases, expressions))
+        )
+        sql, params = inner.values('id', 'page', *aliases).query.sql_with_params()
+
+        sets = ', '.join(
+            '(' + ', '.join([*(aliases[i] for i in grouping_set), 'page']) + ')'
+            for grouping_set in grouping_sets(facets, path)
+        )
+        # count per sampled page first, the sum of the squared page counts
+        # gives the error
+        statement = f"""
+            WITH pages AS (
+                SELECT {columns}, GROUPING({columns}) AS grouping, COUNT(DISTINCT id) AS count
+                FROM ({sql}) AS facets
+                GROUP BY GROUPING SETS ({sets})
+            )
+            SELECT {columns}, grouping, SUM(count)::bigint, SUM(count * count)::bigint
+            FROM pages
+            GROUP BY {columns}, grouping
+            ORDER BY {len(aliases) + 1}, {len(aliases) + 2} DESC
+        """
+    else:
+        fraction = None if sample is None else 1
+        inner = queryset.order_by().annotate(**dict(zip(aliases, expressions)))
+        sql, params = inner.values('id', *aliases).query.sql_with_params()
+
+        sets = ', '.join(
+            '(' + ', '.join(aliases[i] for i in grouping_set) + ')'
+            for grouping_set in grouping_sets(facets, path)
+        )
+        # the joins of multi-valued facets repeat datasets, hence the DISTINCT
+        statement = f"""
+            SELECT {columns}, GROUPING({columns}), COUNT(DISTINCT id)
+            FROM ({sql}) AS facets
+            GROUP BY GROUPING SETS ({sets})
+            ORDER BY {len(aliases) + 1}, {len(aliases) + 2} DESC
+        """
+
+    with connection.cursor() as cursor:
+        cursor.execute(statement, params)
+        rows = cursor.fetchall()
+
+    results = []
+    for row in rows:
+        values, grouping = row[:len(aliases)], row[len(aliases)]
+        bucket = {}
+        for i, value in enumerate(values):
+            # GROUPING sets the bits of the columns left out, first column first
+            if not grouping & (1 << (len(values) - 1 - i)):
+                bucket[names[i]] = value
+
+        if None in bucket.values():
+            continue
+
+        if fraction is None:
+            results.append({'facets': bucket, 'count': row[-1]})
+        elif fraction == 1:
+            results.append({'facets': bucket, 'count': row[-1], 'error': 0})
+        else:
+            count, squares = row[-2:]
+            results.append({
+                'facets': bucket,
+                'count': round(count / fraction),
+                'error': round(1.96 * math.sqrt(squares * (1 - fraction)) / fraction)
+            })
+
+    return results
+
+
+def to_number(field, column):
+    """Return SQL converting a numeric, date or duration column to a number."""
+    if field.get_internal_type() in ('DateField', 'DateTimeField', 'DurationField'):
+        return f'extract(epoch from {column})::double precision'
+    return f'{column}::double precision'
+
+
+def from_number(field, value):
+    """Convert a number computed by ``to_number`` back to the field's type."""
+    internal_type = field.get_internal_type()
+    if internal_type == 'DurationField':
+        return duration_string(timedelta(seconds=value))
+    elif internal_type == 'DateTimeField':
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    elif internal_type == 'DateField':
+        return datetime.fromtimestamp(value, tz=timezone.utc).date()
+    return value
+
+
+def histogram_counts(queryset, histogram):
+    """Count the datasets in ranges of a numeric or date attribute in one statement.
+
+    Bins are of equal width between the smallest and largest value, of
+    equal width in log scale (ignoring values below or equal to zero), or
+    quantiles holding about the same number of datasets.  Returns a list
+    of ``{'lower': value, 'upper': value, 'count': count}``, where the
+    upper bound of a bin is exclusive except for the last one.
+    """
+    field = Dataset._meta.get_field(histogram.name)
+    connection = connections[queryset.db]
+    column = connection.ops.quote_name(field.column)
+
+    sql, params = queryset.order_by().distinct().values('id', field.name).query.sql_with_params()
+
+    value = to_number(field, column)
+    if histogram.scale == 'log':
+        where = f'{value} > 0'
+        value = f'ln({value})'
+    else:
+        where = f'{column} IS NOT NULL'
+
+    if histogram.scale == 'quantile':
+        fractions = [i / histogram.bins for i in range(1, histogram.bins)]
+        thresholds = 'percentile_cont(%s::double precision[]) WITHIN GROUP (ORDER BY value)'
+        bucket = 'width_bucket(value, thresholds) + 1'
+        params = params + (fractions,)
+    else:
+        thresholds = 'NULL::double precision[]'
+        bucket = f"""
+            CASE WHEN high > low THEN least(width_bucket(value, low, high, {histogram.bins}), {histogram.bins})
+            ELSE 1 END
+        """
+
+    statement = f"""
+        WITH facet AS (
+            SELECT {value} AS value FROM ({sql}) AS filtered WHERE {where}
+        ), bounds AS (
+            SELECT min(value) AS low, max(value) AS high, {thresholds} AS thresholds FROM facet
+        )
+        SELECT low, high, thresholds, {bucket} AS bucket, count(*)
+        FROM facet, bounds
+        GROUP BY low, high, thresholds, bucket
+        ORDER BY bucket
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(statement, params)
+        rows = cursor.fetchall()
+
+    if not rows:
+        return []
+
+    low, high, thresholds, _, _ = rows[0]
+    if histogram.scale == 'quantile':
+        edges = [low] + thresholds + [high]
+    else:
+        width = (high - low) / histogram.bins
+        edges = [low + i * width for i in range(histogram.bins)] + [high]
+
+    if histogram.scale == 'log':
+        edges = [math.exp(edge) for edge in edges]
+
+    return [
+        {
+            'lower': from_number(field, edges[bucket - 1]),
+            'upper': from_number(field, edges[bucket]),
+            'count': count
+        }
+        for _, _, _, bucket, count in rows
+    ]
+
+
+def counted_facet_counts(facets, approximate=False):
+    """Return the unfiltered counts of counted facets, like ``facet_counts``.
+
+    The counts are exact, requested as ``approximate`` they come with an error of 0.
+    """
+    names = [facet_name(facet) for facet in facets]
+    rows = FacetCount.objects.filter(facet__in=names, count__gt=0).values_list('facet', 'value', 'count')
+    rows = sorted(rows, key=lambda row: (names.index(row[0]), -row[2]))
+    error = {'error': 0} if approximate else {}
+    return [{'facets': {name: value}, 'count': count, **error} for name, value, count in rows]
+
+
+def expected_facet_counts():
+    """Count every counted facet from the datasets, returning {(facet, value): count}."""
+    counts = {}
+    for name, column in COUNTED_FACETS.items():
+        values = Dataset.objects.filter(**{column + '__isnull': False}).order_by()
+        for value, count in values.values_list(column).annotate(count=Count('id')):
+            counts[(name, value)] = count
+    return counts
+
+
+def facet_request_key(data):
+    """Return a key identifying a facet request by its validated data.
+
+    Parsed facets and queries have deterministic reprs, and equivalent
+    texts parse to equal values, see ``BaseParser.normalize``.
+    """
+    return repr((
+        data.get('facet'),
+        data.get('facets', []),
+        data.get('path', []),
+        data.get('query'),
+        bool(data.get('approximate'))
+    ))
+
+
+class FacetCache:
+    """Facet counts cached per catalog version.
+
+    Writes to the catalog bump its version (see ``catalog_version``), so
+    stale entries are never read again and simply age out of the cache.
+    Counts aren't cached while catalog changes are being written.
+    """
+
+    prefix = 'djaunty:facets'
+
+    def __init__(self, alias, timeout):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_or_compute(self, key, compute):
+        version = catalog_version()
+        if version is None:
+            self.increment('misses')
+            return compute()
+
+        digest = md5(key.encode()).hexdigest()
+        key = f'{self.prefix}:{version}:{digest}'
+
+        value = self.cache.get(key)
+        if value is None:
+            self.increment('misses')
+            value = compute()
+            self.cache.set(key, value, self.timeout)
+        else:
+            self.increment('hits')
+        return value
+
+    def increment(self, counter):
+        key = f'{self.prefix}:{counter}'
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:  # evicted in between
+            pass
+
+    def stats(self):
+        return {
+            'hits': self.cache.get(f'{self.prefix}:hits', 0),
+            'misses': self.cache.get(f'{self.prefix}:misses', 0),
+            'version': catalog_version()
+        }
+
+
+facet_cache = FacetCache(FACET_CACHE, FACET_CACHE_TIMEOUT)
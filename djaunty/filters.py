@@ -1,24 +1,53 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
+
 from rest_framework import exceptions, filters
 
-from .search_parser import ParserException, SearchParser
+from .search_parser import ParserException, search_parsers
+
+
+def rank_by_relevance(queryset, search):
+    """Order the datasets matching the text by ``ts_rank_cd`` over their weighted search vectors.
+
+    The weights are stored in the vectors (see migration 0028), so ranking
+    only reads the precomputed column of the matching rows.  The rank is an
+    ordering expression rather than an annotation, which keeps it out of
+    the count query.
+    """
+    rank = SearchRank(F('search_vector'), SearchQuery(search), cover_density=True)
+    return queryset.filter(search_vector=search).order_by(rank.desc(), 'id')
 
 
 class TextSearchFilter(filters.BaseFilterBackend):
+    """Full text search with ``?search=``, most relevant first with ``?rank=true``.
+
+    An explicit ``?ordering=`` or cursor pagination takes precedence over the ranking.
+    """
+
     def filter_queryset(self, request, queryset, view):
-        search = request.query_params.get('search')
+        return self.filter_params(request.query_params, queryset)
+
+    def filter_params(self, params, queryset):
+        """Filter by the query parameters alone, e.g. those kept by a background job."""
+        search = params.get('search')
         if search:
-            queryset = queryset.filter(search_vector=search)
+            if params.get('rank', '').lower() in ('1', 'true', 'yes'):
+                queryset = rank_by_relevance(queryset, search)
+            else:
+                queryset = queryset.filter(search_vector=search)
         return queryset
 
 
 class ComplexSearchFilter(filters.BaseFilterBackend):
 
     def filter_queryset(self, request, queryset, view):
-        parser = SearchParser()
-        query = request.query_params.get('query')
+        return self.filter_params(request.query_params, queryset)
+
+    def filter_params(self, params, queryset):
+        query = params.get('query')
         if query:
             try:
-                filter = parser.parse(query)
+                filter = search_parsers.parse(query)
             except ParserException as e:
                 detail = f'Invalid query: {e}'
                 raise exceptions.ValidationError(detail=detail)
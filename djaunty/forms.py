@@ -1,14 +1,12 @@
 from django import forms
 
-from .search_parser import ParserException, SearchParser
+from .search_parser import ParserException, search_parsers
 
 
 class SearchField(forms.CharField):
     def clean(self, text):
-        search_parser = SearchParser()
-
         try:
-            parsed = search_parser.parse(text)
+            parsed = search_parsers.parse(text)
         except ParserException as e:
             raise forms.ValidationError(str(e))
 
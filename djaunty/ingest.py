@@ -0,0 +1,278 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Dataset, Keyword, Publication
+from .serializers import DatasetSerializer
+
+# The largest number of datasets accepted in a single bulk request
+INGEST_MAX_ROWS = getattr(settings, 'DJAUNTY_INGEST_MAX_ROWS', 10000)
+
+# The columns identifying a dataset, backed by a unique index (migration 0020)
+NATURAL_KEY = getattr(settings, 'DJAUNTY_NATURAL_KEY', ['path'])
+
+# The columns written by an upsert, every other column is maintained by
+# the database or by Django
+UPSERT_FIELDS = [
+    field for field in Dataset._meta.concrete_fields
+    if field.editable and not field.primary_key and field.name not in ('created', 'updated')
+]
+
+_quote = connection.ops.quote_name
+
+# the columns of the rows written by insert_values
+INSERT_COLUMNS = ', '.join(
+    ['created', 'updated', 'keyword_list', 'doi_list', *(_quote(field.column) for field in UPSERT_FIELDS)]
+)
+
+# The unique index on the natural key (migration 0020), its columns and the
+# ON CONFLICT target matching it
+NATURAL_KEY_INDEX = 'djaunty_dataset_natural_key'
+KEY_COLUMNS = [_quote(Dataset._meta.get_field(name).column) for name in NATURAL_KEY]
+CONFLICT_TARGET = f'({", ".join(KEY_COLUMNS)}) WHERE {" AND ".join(f"{column} IS NOT NULL" for column in KEY_COLUMNS)}'
+
+KEY_TAKEN = f'A dataset with this {", ".join(NATURAL_KEY)} already exists.'
+
+
+def index_rows(data, require_key=False, offset=0):
+    """Validate a list of datasets, returning the valid rows with their index and the errors of the others.
+
+    Errors are reported with the index of the row in the list, plus ``offset``.
+    """
+    context = {'defer_relations': True}
+    rows = []
+    errors = []
+    for index, row in enumerate(data, offset):
+        serializer = DatasetSerializer(data=row, context=context)
+        if not serializer.is_valid():
+            errors.append({'index': index, 'errors': serializer.errors})
+            continue
+
+        missing = [
+            column for column in NATURAL_KEY
+            if require_key and serializer.validated_data.get(column) is None
+        ]
+        if missing:
+            errors.append({
+                'index': index,
+                'errors': {column: ['This field is required.'] for column in missing}
+            })
+        else:
+            rows.append((index, serializer.validated_data))
+    return rows, errors
+
+
+def validate_rows(data, require_key=False, offset=0):
+    """Validate a list of datasets, returning the valid rows and the errors of the others."""
+    rows, errors = index_rows(data, require_key, offset)
+    return [row for _, row in rows], errors
+
+
+def resolve(model, field, values):
+    """Return {value: pk} for the values, creating the missing rows.
+
+    Costs one INSERT ... ON CONFLICT DO NOTHING and one SELECT however many
+    values there are.
+    """
+    values = set(values)
+    if not values:
+        return {}
+
+    model.objects.bulk_create([model(**{field: value}) for value in values], ignore_conflicts=True)
+    return dict(model.objects.filter(**{field + '__in': values}).values_list(field, 'pk'))
+
+
+def insert_values(rows):
+    """Return the VALUES list and parameters inserting rows of validated data into INSERT_COLUMNS."""
+    values = ', '.join(
+        "(now(), now(), '{}', '{}', " + ', '.join(['%s'] * len(UPSERT_FIELDS)) + ')' for _ in rows
+    )
+    params = [
+        field.get_db_prep_save(row.get(field.name), connection)
+        for row in rows for field in UPSERT_FIELDS
+    ]
+    return values, params
+
+
+def ingest_datasets(rows):
+    """Create datasets from validated serializer data in a few set-based statements.
+
+    The keywords and related publications of the rows are given as
+    strings, see the ``defer_relations`` context of ``DatasetSerializer``.
+    Rows whose natural key is taken, by an existing dataset or an earlier
+    row, are skipped.  Returns the ids of the created datasets in the
+    order of the rows, with None for the skipped rows.
+    """
+    rows = [dict(row) for row in rows]
+    if not rows:
+        return []
+
+    keywords = [row.pop('keywords', []) for row in rows]
+    dois = [row.pop('related_publications', []) for row in rows]
+
+    keyword_ids = resolve(Keyword, 'keyword', (k for values in keywords for k in values))
+    publication_ids = resolve(Publication, 'doi', (d for values in dois for d in values))
+
+    values, params = insert_values(rows)
+    statement = f"""
+        INSERT INTO djaunty_dataset ({INSERT_COLUMNS})
+        VALUES {values}
+        ON CONFLICT {CONFLICT_TARGET} DO NOTHING
+        RETURNING {', '.join(KEY_COLUMNS)}, id
+    """
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(statement, params)
+            inserted = iter(cursor.fetchall())
+
+        # the created rows are returned in the order of the VALUES, rows
+        # with a complete key that isn't the next one returned were skipped
+        ids = []
+        current = next(inserted, None)
+        for row in rows:
+            key = natural_key(row)
+            if current is not None and (None in key or tuple(current[:-1]) == key):
+                ids.append(current[-1])
+                current = next(inserted, None)
+            else:
+                ids.append(None)
+
+        Dataset.keywords.through.objects.bulk_create([
+            Dataset.keywords.through(dataset_id=dataset_id, keyword_id=keyword_id)
+            for dataset_id, values in zip(ids, keywords) if dataset_id is not None
+            for keyword_id in dict.fromkeys(keyword_ids[k] for k in values)
+        ])
+        Dataset.related_publications.through.objects.bulk_create([
+            Dataset.related_publications.through(dataset_id=dataset_id, publication_id=publication_id)
+            for dataset_id, values in zip(ids, dois) if dataset_id is not None
+            for publication_id in dict.fromkeys(publication_ids[d] for d in values)
+        ])
+
+    return ids
+
+
+def ingest_rows(data, offset=0):
+    """Validate and create a list of datasets, returning the created ids and the errors of the other rows.
+
+    Rows whose natural key is already taken get an error, they can be
+    written with ``upsert_datasets`` instead.
+    """
+    rows, errors = index_rows(data, offset=offset)
+    ids = ingest_datasets([row for _, row in rows])
+    errors.extend(
+        {'index': index, 'errors': {column: [KEY_TAKEN] for column in NATURAL_KEY}}
+        for (index, _), dataset_id in zip(rows, ids) if dataset_id is None
+    )
+    errors.sort(key=lambda error: error['index'])
+    return [dataset_id for dataset_id in ids if dataset_id is not None], errors
+
+
+def natural_key(row):
+    return tuple(row.get(column) for column in NATURAL_KEY)
+
+
+def sync_links(field, links):
+    """Make the links of the datasets in ``links`` ({dataset id: [target ids]}) exactly those.
+
+    Only the links that differ are deleted or inserted, the ids of the
+    datasets whose links changed are returned.
+    """
+    through = field.remote_field.through
+    table = connection.ops.quote_name(through._meta.db_table)
+    source = connection.ops.quote_name(field.m2m_column_name())
+    target = connection.ops.quote_name(field.m2m_reverse_name())
+
+    dataset_ids = list(links)
+    sources = [dataset_id for dataset_id, targets in links.items() for _ in targets]
+    targets = [target_id for targets in links.values() for target_id in targets]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            DELETE FROM {table} AS link
+            WHERE link.{source} = ANY(%s) AND NOT EXISTS (
+                SELECT 1 FROM unnest(%s::integer[], %s::integer[]) AS wanted(source, target)
+                WHERE wanted.source = link.{source} AND wanted.target = link.{target}
+            )
+            RETURNING link.{source}
+        """, [dataset_ids, sources, targets])
+        changed = {row[0] for row in cursor.fetchall()}
+        cursor.execute(f"""
+            INSERT INTO {table} ({source}, {target})
+            SELECT * FROM unnest(%s::integer[], %s::integer[])
+            ON CONFLICT DO NOTHING
+            RETURNING {source}
+        """, [sources, targets])
+        changed.update(row[0] for row in cursor.fetchall())
+    return changed
+
+
+def upsert_datasets(rows):
+    """Create or update datasets from validated serializer data by their natural key.
+
+    Rows replace every column and link of an existing dataset, but only
+    rows and links that actually change are written, so unchanged
+    datasets keep their ``updated`` time and don't fire any triggers.
+    The last of several rows with the same key wins.
+
+    Returns the ids of the created, updated and unchanged datasets.
+    """
+    rows = list({natural_key(row): dict(row) for row in rows}.values())
+    if not rows:
+        return [], [], []
+
+    keywords = [row.pop('keywords', []) for row in rows]
+    dois = [row.pop('related_publications', []) for row in rows]
+
+    keyword_ids = resolve(Keyword, 'keyword', (k for values in keywords for k in values))
+    publication_ids = resolve(Publication, 'doi', (d for values in dois for d in values))
+
+    columns = [connection.ops.quote_name(field.column) for field in UPSERT_FIELDS]
+    values, params = insert_values(rows)
+
+    statement = f"""
+        INSERT INTO djaunty_dataset AS dataset ({INSERT_COLUMNS})
+        VALUES {values}
+        ON CONFLICT {CONFLICT_TARGET}
+        DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in columns)}, updated = now()
+        WHERE ({', '.join(f'dataset.{column}' for column in columns)})
+            IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in columns)})
+        RETURNING id, xmax = 0
+    """
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(statement, params)
+            written = dict(cursor.fetchall())
+
+        # rows that didn't change aren't returned, look every row up by its key
+        ids = {}
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), 1000):
+                keys = [natural_key(row) for row in rows[start:start + 1000]]
+                placeholders = ', '.join('(' + ', '.join(['%s'] * len(KEY_COLUMNS)) + ')' for _ in keys)
+                cursor.execute(
+                    f'SELECT {", ".join(KEY_COLUMNS)}, id FROM djaunty_dataset '
+                    f'WHERE ({", ".join(KEY_COLUMNS)}) IN (VALUES {placeholders})',
+                    [value for values in keys for value in values]
+                )
+                ids.update((tuple(found[:-1]), found[-1]) for found in cursor.fetchall())
+
+        dataset_ids = [ids[natural_key(row)] for row in rows]
+        relinked = sync_links(Dataset.keywords.field, {
+            dataset_id: list(dict.fromkeys(keyword_ids[k] for k in values))
+            for dataset_id, values in zip(dataset_ids, keywords)
+        })
+        relinked |= sync_links(Dataset.related_publications.field, {
+            dataset_id: list(dict.fromkeys(publication_ids[d] for d in values))
+            for dataset_id, values in zip(dataset_ids, dois)
+        })
+
+        # datasets whose columns didn't change but whose links did are updated
+        # too, the link triggers move their updated time (migration 0025)
+        relinked.difference_update(written)
+        written.update(dict.fromkeys(relinked, False))
+
+    created = [pk for pk in dataset_ids if written.get(pk) is True]
+    updated = [pk for pk in dataset_ids if written.get(pk) is False]
+    unchanged = [pk for pk in dataset_ids if pk not in written]
+    return created, updated, unchanged
@@ -0,0 +1,244 @@
+from datetime import timedelta
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+
+from rest_framework.exceptions import ValidationError
+
+from .bulk import bulk_delete, bulk_update
+from .datatags import refresh_changed_datasets, refresh_datatag
+from .export import EXPORT_CHUNK_SIZE, export_lines, write_export
+from .filters import ComplexSearchFilter, TextSearchFilter
+from .ingest import NATURAL_KEY, ingest_rows, upsert_datasets, validate_rows
+from .management.commands.reindex_search import reindex_chunk
+from .models import DataTag, Dataset, Job
+from .representation import dataset_representation, dataset_values
+from .serializers import DatasetBulkSerializer
+
+# The number of processes started by run_workers
+JOB_WORKERS = getattr(settings, 'DJAUNTY_JOB_WORKERS', 2)
+
+# The number of seconds an idle worker waits before looking for jobs again
+JOB_POLL_INTERVAL = getattr(settings, 'DJAUNTY_JOB_POLL_INTERVAL', 1.0)
+
+# The number of seconds a running job is held without renewing its lease,
+# and the number of times a job is claimed before it's given up
+JOB_LEASE = getattr(settings, 'DJAUNTY_JOB_LEASE', 60)
+JOB_MAX_ATTEMPTS = getattr(settings, 'DJAUNTY_JOB_MAX_ATTEMPTS', 3)
+
+# The number of rows ingested between progress reports
+JOB_CHUNK_SIZE = 1000
+
+# The number of queued search vectors or changed datasets an idle worker
+# refreshes at a time
+QUEUE_BATCH_SIZE = 1000
+
+# kind -> function(job, **params) returning a JSON serializable result
+job_kinds = {}
+
+
+def job_kind(name):
+    def register(func):
+        job_kinds[name] = func
+        return func
+    return register
+
+
+def enqueue(kind, **params):
+    if kind not in job_kinds:
+        raise ValueError(f'Unknown job kind "{kind}"')
+    return Job.objects.create(kind=kind, params=params)
+
+
+def report_progress(job, done, total=None):
+    job.done = done
+    if total is not None:
+        job.total = total
+    Job.objects.filter(pk=job.pk).update(done=job.done, total=job.total)
+
+
+def lease_end():
+    return timezone.now() + timedelta(seconds=JOB_LEASE)
+
+
+def claim_job():
+    """Take the oldest queued job, skipping the ones other workers are claiming.
+
+    Running jobs whose lease expired lost their worker (e.g. it crashed
+    or was terminated) and are claimed again, until they have been tried
+    ``JOB_MAX_ATTEMPTS`` times, then they fail.
+    """
+    while True:
+        with transaction.atomic():
+            job = Job.objects.select_for_update(skip_locked=True).filter(
+                Q(status=Job.QUEUED) | Q(status=Job.RUNNING, lease_expires__lt=timezone.now())
+            ).order_by('id').first()
+            if job is None:
+                return None
+
+            if job.attempts >= JOB_MAX_ATTEMPTS:
+                job.status = Job.FAILED
+                job.error = f'The job was abandoned by its worker {job.attempts} times'
+                job.finished = timezone.now()
+                job.lease_expires = None
+                job.save(update_fields=['status', 'error', 'finished', 'lease_expires'])
+                continue
+
+            job.status = Job.RUNNING
+            job.started = timezone.now()
+            job.lease_expires = lease_end()
+            job.attempts += 1
+            job.save(update_fields=['status', 'started', 'lease_expires', 'attempts'])
+            return job
+
+
+def drain_queues(batch_size=QUEUE_BATCH_SIZE):
+    """Work off a batch of the queues filled by triggers, returning the number of rows taken off.
+
+    Those are the datasets whose search vectors are out of date (migration
+    0021) and the datasets changed since the live data tags were refreshed
+    (migration 0022).  Concurrent workers skip each other's batches.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT djaunty_refresh_search_vectors(%s)', [batch_size])
+        drained = cursor.fetchone()[0]
+    return drained + refresh_changed_datasets(batch_size)
+
+
+class Heartbeat(threading.Thread):
+    """Renews the lease of a running job until stopped."""
+
+    def __init__(self, job):
+        super().__init__(daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(JOB_LEASE / 3):
+                Job.objects.filter(pk=self.job.pk, status=Job.RUNNING).update(lease_expires=lease_end())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        result = job_kinds[job.kind](job, **job.params)
+    except Exception:
+        job.status = Job.FAILED
+        job.error = traceback.format_exc()
+        job.result = None
+    else:
+        job.status = Job.SUCCEEDED
+        job.result = result
+    finally:
+        heartbeat.stop()
+
+    job.finished = timezone.now()
+    job.lease_expires = None
+    job.save(update_fields=['status', 'result', 'error', 'finished', 'lease_expires'])
+
+
+@job_kind('refresh_datatag')
+def refresh_datatag_job(job, datatag):
+    added, removed = refresh_datatag(DataTag.objects.get(pk=datatag))
+    return {'added': added, 'removed': removed}
+
+
+@job_kind('ingest_datasets')
+def ingest_datasets_job(job, rows):
+    ids = []
+    errors = []
+    for start in range(0, len(rows), JOB_CHUNK_SIZE):
+        created, invalid = ingest_rows(rows[start:start + JOB_CHUNK_SIZE], offset=start)
+        ids.extend(created)
+        errors.extend(invalid)
+        report_progress(job, min(start + JOB_CHUNK_SIZE, len(rows)), len(rows))
+    return {'created': len(ids), 'ids': ids, 'errors': errors}
+
+
+@job_kind('upsert_datasets')
+def upsert_datasets_job(job, rows):
+    result = {'created': [], 'updated': [], 'unchanged': [], 'errors': []}
+    for start in range(0, len(rows), JOB_CHUNK_SIZE):
+        valid, invalid = validate_rows(rows[start:start + JOB_CHUNK_SIZE], require_key=True, offset=start)
+        for key, ids in zip(['created', 'updated', 'unchanged'], upsert_datasets(valid)):
+            result[key].extend(ids)
+        result['errors'].extend(invalid)
+        report_progress(job, min(start + JOB_CHUNK_SIZE, len(rows)), len(rows))
+    return result
+
+
+def bulk_request(data, require_patch=False):
+    """Validate the data of a bulk update or delete, for the API and the jobs alike."""
+    serializer = DatasetBulkSerializer(data=data, context={'natural_key': NATURAL_KEY})
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    if require_patch and not data.get('patch'):
+        raise ValidationError({'patch': ['This field is required.']})
+    return data
+
+
+@job_kind('bulk_update')
+def bulk_update_job(job, data):
+    data = bulk_request(data, require_patch=True)
+    total = Dataset.objects.filter(data['query']).count()
+    report_progress(job, 0, total)
+    updated = bulk_update(data['query'], data['patch'], progress=lambda done: report_progress(job, done))
+    return {'updated': updated}
+
+
+@job_kind('bulk_delete')
+def bulk_delete_job(job, data):
+    data = bulk_request(data)
+    total = Dataset.objects.filter(data['query']).count()
+    report_progress(job, 0, total)
+    deleted = bulk_delete(data['query'], progress=lambda done: report_progress(job, done))
+    return {'deleted': deleted.get(Dataset._meta.label, 0), 'links': deleted}
+
+
+@job_kind('export_datasets')
+def export_datasets_job(job, params, fields, output):
+    """Export the datasets selected by the search parameters, to download from the job."""
+    queryset = Dataset.objects.order_by('id')
+    for backend in (TextSearchFilter, ComplexSearchFilter):
+        queryset = backend().filter_params(params, queryset)
+    report_progress(job, 0, queryset.count())
+
+    def rows():
+        values = dataset_values(queryset, fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for done, row in enumerate(values, 1):
+            if done % EXPORT_CHUNK_SIZE == 0:
+                report_progress(job, done)
+            yield dataset_representation(row, fields)
+        report_progress(job, job.total)
+
+    name = f'datasets-{job.pk}.{output}'
+    write_export(name, export_lines(rows(), output, fields))
+    return {'exported': job.total, 'file': name, 'output': output}
+
+
+@job_kind('reindex_search')
+def reindex_search_job(job, chunk_size=JOB_CHUNK_SIZE):
+    """Rebuild every search vector in short id range transactions, like reindex_search."""
+    bounds = Dataset.objects.aggregate(first=Min('id'), last=Max('id'), total=Count('id'))
+    report_progress(job, 0, bounds['total'])
+    if not bounds['total']:
+        return {'reindexed': 0}
+
+    reindexed = 0
+    for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+        _, rows, _ = reindex_chunk((start, start + chunk_size, 0))
+        reindexed += rows
+        report_progress(job, reindexed)
+    return {'reindexed': reindexed}
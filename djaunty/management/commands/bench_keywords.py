@@ -0,0 +1,83 @@
+from random import sample
+import time
+
+from django.core.management import BaseCommand
+from django.db.models import Q
+
+from ...models import Dataset, Keyword, Publication
+from ...search_parser import search_parsers
+
+
+def join_filter(attribute, op, values):
+    """Compile a rule the way the parser did before the array columns."""
+    if op == 'in':
+        return Q(**{f'{attribute}__in': values})
+    elif op == '~=':
+        return Q(**{f'{attribute}__icontains': values[0]})
+    return Q(**{f'{attribute}__iexact': values[0]})
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare keyword and DOI filtering through joins against the array '
+        'columns, e.g. on a catalog seeded with --dataset-count 1000000'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--samples',
+            default=20,
+            type=int,
+            help='The number of random values to query for each rule'
+        )
+        parser.add_argument(
+            '--page-size',
+            default=25,
+            type=int,
+            help='The number of rows fetched for each query'
+        )
+
+    def time_query(self, q, page_size):
+        start = time.perf_counter()
+        qs = Dataset.objects.filter(q).order_by('id')
+        qs.count()
+        list(qs.values_list('id', flat=True)[:page_size])
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        samples = options['samples']
+        page_size = options['page_size']
+
+        keywords = list(Keyword.objects.order_by('?').values_list('keyword', flat=True)[:samples * 2])
+        dois = list(Publication.objects.order_by('?').values_list('doi', flat=True)[:samples * 2])
+        if not keywords or not dois:
+            self.stderr.write('Seed the database first')
+            return
+
+        cases = [
+            ('keyword', 'keywords__keyword', '=', keywords),
+            ('keyword', 'keywords__keyword', 'in', keywords),
+            ('keyword', 'keywords__keyword', '~=', keywords),
+            ('doi', 'related_publications__doi', '=', dois),
+            ('doi', 'related_publications__doi', 'in', dois),
+        ]
+
+        for name, attribute, op, values in cases:
+            join_time = array_time = 0
+            for _ in range(samples):
+                chosen = sample(values, k=min(3, len(values)))
+                if op == 'in':
+                    text = f'{name} in [' + ', '.join(f"'{v}'" for v in chosen) + ']'
+                elif op == '~=':
+                    chosen = [chosen[0][1:4]]
+                    text = f"{name} ~= '{chosen[0]}'"
+                else:
+                    text = f"{name} = '{chosen[0]}'"
+
+                join_time += self.time_query(join_filter(attribute, op, chosen), page_size)
+                array_time += self.time_query(search_parsers.parse(text), page_size)
+
+            self.stdout.write(
+                f'{name} {op:>2}: join {1000 * join_time / samples:8.2f} ms  '
+                f'array {1000 * array_time / samples:8.2f} ms'
+            )
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+import re
+import time
+
+from django.core.management import BaseCommand
+
+from ply import lex, yacc
+
+from ...search_parser import ParserPool, SearchParser, search_parsers
+
+QUERIES = [
+    "lab = 'Smith Lab'",
+    "keyword in ['mouse', 'cortex'] and electrodes > 32",
+    "not (institution ~= 'university' or experimenter = null)",
+    "doi = '10.1000/xyz' and units <= 100 and lab != 'Doe Lab'",
+]
+
+
+def parse_rebuilding_tables(text):
+    """Parse the way every request used to: generating the tables first."""
+    module = object.__new__(SearchParser)
+    lexer = lex.lex(module=module, reflags=re.IGNORECASE)
+    parser = yacc.yacc(module=module, write_tables=False, debug=False)
+    return parser.parse(text, lexer=lexer)
+
+
+class Command(BaseCommand):
+    help = 'Measure search query parsing throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations',
+            default=2000,
+            type=int,
+            help='The number of queries to parse in each mode'
+        )
+        parser.add_argument(
+            '--threads',
+            default=4,
+            type=int,
+            help='The number of threads parsing concurrently'
+        )
+
+    def run(self, parse, iterations, threads):
+        texts = [QUERIES[i % len(QUERIES)] for i in range(iterations)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(parse, texts))
+        return iterations / (time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        iterations = options['iterations']
+
+        # the rebuilding mode is orders of magnitude slower, keep it short
+        before = self.run(parse_rebuilding_tables, max(iterations // 20, 1), threads)
+
+        # without a cache every query is parsed, measuring the pool itself
+        uncached = ParserPool(SearchParser, cache_size=0)
+        pooled = self.run(uncached.parse, iterations, threads)
+
+        search_parsers.cache.clear()
+        cached = self.run(search_parsers.parse, iterations, threads)
+
+        self.stdout.write(f'rebuilding tables: {before:10.1f} queries/sec')
+        self.stdout.write(f'pooled parsers:    {pooled:10.1f} queries/sec')
+        self.stdout.write(f'speedup:           {pooled / before:10.1f}x')
+        self.stdout.write(f'pooled and cached: {cached:10.1f} queries/sec')
+
+        stats = search_parsers.cache.stats()
+        self.stdout.write(f'query cache:       {stats["hits"]} hits, {stats["misses"]} misses')
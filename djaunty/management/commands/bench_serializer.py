@@ -0,0 +1,61 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from ...models import Dataset
+from ...representation import dataset_representation, dataset_values
+from ...serializers import DatasetSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare DatasetSerializer list serialization against the values() read path'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            default=1000,
+            type=int,
+            help='The number of datasets serialized in each run'
+        )
+        parser.add_argument(
+            '--repeat',
+            default=5,
+            type=int,
+            help='The number of runs of each mode'
+        )
+
+    def run(self, serialize, rows, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            data = serialize()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return data, rows / best
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+        queryset = Dataset.objects.order_by('id')[:rows]
+        rows = queryset.count()
+        if not rows:
+            self.stderr.write('Seed the database first')
+            return
+
+        modes = [
+            ('serializer', lambda: DatasetSerializer(queryset, many=True).data),
+            ('serializer + prefetch', lambda: DatasetSerializer(
+                queryset.prefetch_related('keywords', 'related_publications'), many=True
+            ).data),
+            ('values', lambda: [dataset_representation(row) for row in dataset_values(queryset)]),
+        ]
+
+        results = {}
+        for name, serialize in modes:
+            data, rate = self.run(serialize, rows, repeat)
+            results[name] = data
+            self.stdout.write(f'{name:<22} {rate:10.1f} rows/sec')
+
+        if [dict(row) for row in results['serializer']] != results['values']:
+            raise CommandError('The values() read path renders datasets differently')
+        self.stdout.write('Both paths render identical data')
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from ...changes import prune_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete old entries of the dataset change feed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            default=30,
+            type=int,
+            help='The number of days of changes to keep, followers syncing less often have to start over'
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        deleted = prune_changes(before)
+        self.stdout.write(f'Deleted {deleted} changes')
@@ -0,0 +1,52 @@
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+
+from ...facets import expected_facet_counts
+from ...models import FacetCount
+
+
+class Command(BaseCommand):
+    help = 'Check the maintained facet counts against the datasets and rebuild them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report drift, without rebuilding'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            # keep writers out, the triggers would race the rebuild
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'LOCK TABLE djaunty_dataset, djaunty_dataset_keywords, djaunty_keyword IN SHARE MODE'
+                )
+
+            expected = expected_facet_counts()
+            actual = {
+                (facet, value): count
+                for facet, value, count in FacetCount.objects.values_list('facet', 'value', 'count')
+                if count > 0
+            }
+
+            drift = 0
+            for key in sorted(set(expected) | set(actual), key=str):
+                if expected.get(key) != actual.get(key):
+                    drift += 1
+                    facet, value = key
+                    self.stdout.write(
+                        f'{facet} = {value!r}: counted {actual.get(key, 0)}, '
+                        f'expected {expected.get(key, 0)}'
+                    )
+
+            self.stdout.write(f'{drift} facet counts drifted')
+            if options['check'] or not drift:
+                return
+
+            FacetCount.objects.all().delete()
+            FacetCount.objects.bulk_create(
+                FacetCount(facet=facet, value=value, count=count)
+                for (facet, value), count in expected.items()
+            )
+            self.stdout.write(f'Rebuilt {len(expected)} facet counts')
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management import BaseCommand
+
+from ...datatags import DataTagTooLarge, refresh_changed_datasets, refresh_datatag
+from ...models import DataTag
+
+
+class Command(BaseCommand):
+    help = 'Bring the live data tags up to date with the changed datasets'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='The number of changed datasets re-evaluated in each transaction'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Re-run the query of every live tag over all datasets instead'
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep draining the queue as a worker instead of exiting once it is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            default=5.0,
+            type=float,
+            help='The number of seconds to wait for new work with --watch'
+        )
+
+    def handle(self, *args, **options):
+        if options['full']:
+            for datatag in DataTag.objects.filter(live=True, query__isnull=False):
+                try:
+                    added, removed = refresh_datatag(datatag)
+                except DataTagTooLarge as e:
+                    self.stderr.write(f'{datatag.name}: {e}')
+                    continue
+                self.stdout.write(f'{datatag.name}: {added} added, {removed} removed')
+            return
+
+        total = 0
+        while True:
+            refreshed = refresh_changed_datasets(options['batch_size'])
+            total += refreshed
+
+            if refreshed:
+                continue
+            if not options['watch']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(f'Re-evaluated {total} changed datasets')
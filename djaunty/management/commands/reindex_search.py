@@ -0,0 +1,123 @@
+import json
+from multiprocessing import Pool
+import os
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from ...models import Dataset
+
+
+def reindex_chunk(chunk):
+    """Rebuild the search vectors of the datasets with ids in [start, stop) in one transaction."""
+    start, stop, pause = chunk
+    began = time.perf_counter()
+    with transaction.atomic(), connection.cursor() as cursor:
+        # let the row trigger accept the new vectors, see migration 0021
+        cursor.execute("SELECT set_config('djaunty.search_refresh', 'on', true)")
+        cursor.execute(
+            'UPDATE djaunty_dataset d SET search_vector = djaunty_search_vector(d) '
+            'WHERE id >= %s AND id < %s',
+            [start, stop]
+        )
+        rows = cursor.rowcount
+
+    # throttle, leaving room for the regular workload
+    time.sleep(pause)
+    return start, rows, time.perf_counter() - began
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild every search vector online, in short id-range transactions '
+        'spread over several processes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            default=5000,
+            type=int,
+            help='The width of the id range rebuilt in each transaction'
+        )
+        parser.add_argument(
+            '--workers',
+            default=4,
+            type=int,
+            help='The number of processes rebuilding chunks concurrently'
+        )
+        parser.add_argument(
+            '--pause',
+            default=0.0,
+            type=float,
+            help='The number of seconds each worker sleeps after a chunk'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default='reindex_search.checkpoint',
+            help='The file recording the finished chunks, to resume after an interruption'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and rebuild everything'
+        )
+
+    def load_checkpoint(self, path, chunk_size, restart):
+        if restart or not os.path.exists(path):
+            return set()
+
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint['chunk_size'] != chunk_size:
+            raise CommandError(
+                f'The checkpoint was written with --chunk-size {checkpoint["chunk_size"]}, '
+                'pass the same size or --restart'
+            )
+        return set(checkpoint['done'])
+
+    def save_checkpoint(self, path, chunk_size, done):
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'chunk_size': chunk_size, 'done': sorted(done)}, f)
+        os.replace(path + '.tmp', path)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        path = options['checkpoint']
+
+        done = self.load_checkpoint(path, chunk_size, options['restart'])
+        bounds = Dataset.objects.order_by('id').values_list('id', flat=True)
+        first, last = bounds.first(), bounds.last()
+        if first is None:
+            self.stdout.write('There are no datasets')
+            return
+
+        first -= first % chunk_size
+        chunks = [
+            (start, start + chunk_size, options['pause'])
+            for start in range(first, last + 1, chunk_size)
+            if start not in done
+        ]
+        if done:
+            self.stdout.write(f'Resuming, {len(done)} chunks were already rebuilt')
+
+        # the workers are forked, they must not share the parent's connections
+        connections.close_all()
+
+        total = 0
+        began = time.perf_counter()
+        with Pool(options['workers']) as pool:
+            for index, (start, rows, elapsed) in enumerate(pool.imap_unordered(reindex_chunk, chunks), 1):
+                done.add(start)
+                self.save_checkpoint(path, chunk_size, done)
+
+                total += rows
+                rate = total / (time.perf_counter() - began)
+                self.stdout.write(
+                    f'[{index}/{len(chunks)}] ids {start}-{start + chunk_size - 1}: '
+                    f'{rows} rows in {elapsed:.2f}s, {rate:.0f} rows/sec overall'
+                )
+
+        os.remove(path)
+        self.stdout.write(f'Rebuilt {total} search vectors in {time.perf_counter() - began:.1f}s')
@@ -0,0 +1,74 @@
+import logging
+from multiprocessing import Process
+import time
+
+from django.core.management import BaseCommand
+from django.db import DatabaseError, connection, connections
+
+from ...jobs import JOB_POLL_INTERVAL, JOB_WORKERS, claim_job, drain_queues, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def work(once):
+    while True:
+        try:
+            job = claim_job()
+            if job is not None:
+                run_job(job)
+                continue
+
+            # between jobs, new and changed datasets are made searchable
+            # and brought into their live tags
+            if drain_queues():
+                continue
+        except DatabaseError:
+            # e.g. the database restarted, a job left running is claimed
+            # again once its lease runs out
+            logger.exception('The worker lost its database connection, retrying')
+            connection.close()
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+
+        if once:
+            return
+        time.sleep(JOB_POLL_INTERVAL)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs in a pool of worker processes, refreshing '
+        'queued search vectors and live data tags in between'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            default=JOB_WORKERS,
+            type=int,
+            help='The number of jobs run concurrently'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queues are empty instead of waiting for more work'
+        )
+
+    def handle(self, *args, **options):
+        # the workers are forked, they must not share the parent's connections
+        connections.close_all()
+
+        workers = [
+            Process(target=work, args=(options['once'],))
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {len(workers)} workers')
+
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -1,6 +1,6 @@
 from random import randint, sample
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, call_command
 
 from tqdm import tqdm
 
@@ -91,3 +91,6 @@ class Command(BaseCommand):
 
             Dataset.related_publications.through.objects.bulk_create(publication_links)
             Dataset.keywords.through.objects.bulk_create(keyword_links)
+
+        # search vectors are refreshed from a queue, drain it once at the end
+        call_command('update_search_vectors', stdout=self.stdout)
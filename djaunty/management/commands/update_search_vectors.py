@@ -0,0 +1,57 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Refresh the search vectors of the queued datasets in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            default=1000,
+            type=int,
+            help='The number of datasets refreshed in each transaction'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Queue every dataset first'
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep draining the queue as a worker instead of exiting once it is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            default=5.0,
+            type=float,
+            help='The number of seconds to wait for new work with --watch'
+        )
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if options['all']:
+                cursor.execute(
+                    'INSERT INTO djaunty_searchvectorqueue (dataset_id) '
+                    'SELECT id FROM djaunty_dataset ON CONFLICT DO NOTHING'
+                )
+
+            total = 0
+            start = time.perf_counter()
+            while True:
+                # each call commits on its own, so workers can run concurrently
+                cursor.execute('SELECT djaunty_refresh_search_vectors(%s)', [options['batch_size']])
+                refreshed = cursor.fetchone()[0]
+                total += refreshed
+
+                if refreshed:
+                    continue
+                if not options['watch']:
+                    break
+                time.sleep(options['interval'])
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Refreshed {total} search vectors in {elapsed:.1f}s')
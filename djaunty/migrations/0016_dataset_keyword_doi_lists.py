@@ -0,0 +1,171 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:25
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0015_remove_dataset_sex'),
+    ]
+
+    migration = """
+        CREATE OR REPLACE FUNCTION djaunty_text_search_update() RETURNS trigger as $$
+        begin
+            NEW.keyword_list := ARRAY(
+                SELECT lower(k.keyword)
+                FROM djaunty_keyword k
+                JOIN djaunty_dataset_keywords dk ON dk.keyword_id = k.id
+                WHERE dk.dataset_id = NEW.id
+                ORDER BY dk.id
+            );
+
+            NEW.doi_list := ARRAY(
+                SELECT lower(p.doi)
+                FROM djaunty_publication p
+                JOIN djaunty_dataset_related_publications dp ON dp.publication_id = p.id
+                WHERE dp.dataset_id = NEW.id
+                ORDER BY dp.id
+            );
+
+            NEW.search_vector :=
+                to_tsvector(coalesce(NEW.genotype, '')) ||
+                to_tsvector(coalesce(NEW.lab, '')) ||
+                to_tsvector(coalesce(NEW.experimenter, '')) ||
+                to_tsvector(coalesce(NEW.species, '')) ||
+                to_tsvector(coalesce(NEW.identifier, '')) ||
+                to_tsvector(coalesce(NEW.session_description, '')) ||
+                to_tsvector(coalesce(NEW.experiment_description, '')) ||
+                to_tsvector(coalesce(NEW.institution, '')) ||
+                to_tsvector(array_to_string(NEW.keyword_list, ' ')) ||
+                to_tsvector(array_to_string(NEW.doi_list, ' '));
+
+            return NEW;
+        end
+        $$ LANGUAGE plpgsql;
+
+        -- Touch datasets whose links changed so that the trigger above
+        -- recomputes their denormalized columns.
+        CREATE FUNCTION djaunty_dataset_links_update() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET id = id
+            WHERE id IN (SELECT dataset_id FROM changed_links);
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_dataset_keywords_insert AFTER INSERT
+            ON djaunty_dataset_keywords REFERENCING NEW TABLE AS changed_links
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_links_update();
+        CREATE TRIGGER djaunty_dataset_keywords_delete AFTER DELETE
+            ON djaunty_dataset_keywords REFERENCING OLD TABLE AS changed_links
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_links_update();
+        CREATE TRIGGER djaunty_dataset_publications_insert AFTER INSERT
+            ON djaunty_dataset_related_publications REFERENCING NEW TABLE AS changed_links
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_links_update();
+        CREATE TRIGGER djaunty_dataset_publications_delete AFTER DELETE
+            ON djaunty_dataset_related_publications REFERENCING OLD TABLE AS changed_links
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_links_update();
+
+        CREATE FUNCTION djaunty_keyword_rename() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET id = id
+            WHERE id IN (
+                SELECT dataset_id FROM djaunty_dataset_keywords WHERE keyword_id = NEW.id
+            );
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE FUNCTION djaunty_publication_rename() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET id = id
+            WHERE id IN (
+                SELECT dataset_id FROM djaunty_dataset_related_publications WHERE publication_id = NEW.id
+            );
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_keyword_rename AFTER UPDATE OF keyword ON djaunty_keyword
+            FOR EACH ROW WHEN (OLD.keyword IS DISTINCT FROM NEW.keyword)
+            EXECUTE PROCEDURE djaunty_keyword_rename();
+        CREATE TRIGGER djaunty_publication_rename AFTER UPDATE OF doi ON djaunty_publication
+            FOR EACH ROW WHEN (OLD.doi IS DISTINCT FROM NEW.doi)
+            EXECUTE PROCEDURE djaunty_publication_rename();
+
+        -- Force trigger to run on all rows
+        UPDATE djaunty_dataset SET id = id;
+    """
+
+    reverse_migration = """
+        DROP TRIGGER djaunty_keyword_rename ON djaunty_keyword;
+        DROP TRIGGER djaunty_publication_rename ON djaunty_publication;
+        DROP FUNCTION djaunty_keyword_rename;
+        DROP FUNCTION djaunty_publication_rename;
+
+        DROP TRIGGER djaunty_dataset_keywords_insert ON djaunty_dataset_keywords;
+        DROP TRIGGER djaunty_dataset_keywords_delete ON djaunty_dataset_keywords;
+        DROP TRIGGER djaunty_dataset_publications_insert ON djaunty_dataset_related_publications;
+        DROP TRIGGER djaunty_dataset_publications_delete ON djaunty_dataset_related_publications;
+        DROP FUNCTION djaunty_dataset_links_update;
+
+        CREATE OR REPLACE FUNCTION djaunty_text_search_update() RETURNS trigger as $$
+        declare
+            keywords text;
+            publications text;
+        begin
+            SELECT
+                string_agg(k.keyword, ' ') INTO keywords
+            FROM djaunty_keyword k
+            JOIN djaunty_dataset_keywords dk ON dk.keyword_id = k.id
+            WHERE dk.dataset_id = NEW.id
+            GROUP BY dk.dataset_id;
+
+            SELECT
+                string_agg(p.doi, ' ') INTO publications
+            FROM djaunty_publication p
+            JOIN djaunty_dataset_related_publications dp ON dp.publication_id = p.id
+            WHERE dp.dataset_id = NEW.id
+            GROUP BY dp.dataset_id;
+
+            NEW.search_vector :=
+                to_tsvector(coalesce(NEW.genotype, '')) ||
+                to_tsvector(coalesce(NEW.lab, '')) ||
+                to_tsvector(coalesce(NEW.experimenter, '')) ||
+                to_tsvector(coalesce(NEW.species, '')) ||
+                to_tsvector(coalesce(NEW.identifier, '')) ||
+                to_tsvector(coalesce(NEW.session_description, '')) ||
+                to_tsvector(coalesce(NEW.experiment_description, '')) ||
+                to_tsvector(coalesce(NEW.institution, '')) ||
+                to_tsvector(coalesce(keywords, '')) ||
+                to_tsvector(coalesce(publications, ''));
+
+            return NEW;
+        end
+        $$ LANGUAGE plpgsql;
+    """
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='doi_list',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='keyword_list',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=63), default=list, editable=False, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['keyword_list'], name='djaunty_dat_keyword_0cbea1_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['doi_list'], name='djaunty_dat_doi_lis_63a565_gin'),
+        ),
+        migrations.RunSQL(migration, reverse_migration),
+    ]
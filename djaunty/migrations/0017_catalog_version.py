@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:02
+
+from django.db import migrations
+
+# Every table a cached result (e.g. facet counts) can depend on
+CATALOG_TABLES = [
+    'djaunty_dataset',
+    'djaunty_keyword',
+    'djaunty_publication',
+    'djaunty_dataset_keywords',
+    'djaunty_dataset_related_publications',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0016_dataset_keyword_doi_lists'),
+    ]
+
+    # The triggers are deferred to the end of the transaction, which only
+    # narrows the window in which readers see the new version but not the
+    # changes yet: sequences aren't transactional, so nextval is visible
+    # before the commit.  Migration 0029 replaces them.
+    migration = """
+        CREATE SEQUENCE djaunty_catalog_version;
+        -- last_value doesn't change on the first nextval of a new sequence
+        SELECT nextval('djaunty_catalog_version');
+
+        CREATE FUNCTION djaunty_catalog_version_bump() RETURNS trigger as $$
+        begin
+            PERFORM nextval('djaunty_catalog_version');
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+    """ + ''.join(f"""
+        CREATE CONSTRAINT TRIGGER djaunty_catalog_version AFTER INSERT OR UPDATE OR DELETE
+            ON {table} DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE PROCEDURE djaunty_catalog_version_bump();
+    """ for table in CATALOG_TABLES)
+
+    reverse_migration = ''.join(f"""
+        DROP TRIGGER djaunty_catalog_version ON {table};
+    """ for table in CATALOG_TABLES) + """
+        DROP FUNCTION djaunty_catalog_version_bump;
+        DROP SEQUENCE djaunty_catalog_version;
+    """
+
+    operations = [
+        migrations.RunSQL(migration, reverse_migration)
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0017_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=63)),
+                ('value', models.CharField(max_length=255)),
+                ('count', models.BigIntegerField()),
+            ],
+            options={
+                'unique_together': {('facet', 'value')},
+            },
+        ),
+    ]
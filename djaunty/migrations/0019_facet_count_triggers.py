@@ -0,0 +1,117 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+from django.db import migrations
+
+FACET_COLUMNS = ['lab', 'institution', 'species', 'experimenter']
+
+# one (facet, value) row per counted column of every row of the table
+FACET_VALUES = 'LATERAL (VALUES ' + ', '.join(
+    f"('{column}', {column})" for column in FACET_COLUMNS
+) + ') AS f(facet, value)'
+
+UPSERT = """
+    INSERT INTO djaunty_facetcount (facet, value, count)
+    SELECT facet, value, sum(delta) FROM ({changes}) AS changes
+    WHERE value IS NOT NULL
+    GROUP BY facet, value
+    HAVING sum(delta) <> 0
+    ON CONFLICT (facet, value) DO UPDATE SET count = djaunty_facetcount.count + EXCLUDED.count;
+"""
+
+DATASET_CHANGES = f'SELECT f.facet, f.value, {{delta}} AS delta FROM {{table}}, {FACET_VALUES}'
+
+KEYWORD_CHANGES = """
+    SELECT 'keyword' AS facet, k.keyword AS value, {delta} AS delta
+    FROM {table} dk JOIN djaunty_keyword k ON k.id = dk.keyword_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0018_facetcount'),
+    ]
+
+    migration = f"""
+        CREATE FUNCTION djaunty_dataset_facet_counts() RETURNS trigger as $$
+        begin
+            IF TG_OP = 'INSERT' THEN
+                {UPSERT.format(changes=DATASET_CHANGES.format(table='new_rows', delta=1))}
+            ELSIF TG_OP = 'DELETE' THEN
+                {UPSERT.format(changes=DATASET_CHANGES.format(table='old_rows', delta=-1))}
+            ELSE
+                {UPSERT.format(changes=(
+                    DATASET_CHANGES.format(table='new_rows', delta=1) + ' UNION ALL ' +
+                    DATASET_CHANGES.format(table='old_rows', delta=-1)
+                ))}
+            END IF;
+
+            DELETE FROM djaunty_facetcount WHERE count <= 0;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_dataset_facet_counts_insert AFTER INSERT
+            ON djaunty_dataset REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_facet_counts();
+        CREATE TRIGGER djaunty_dataset_facet_counts_update AFTER UPDATE
+            ON djaunty_dataset REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_facet_counts();
+        CREATE TRIGGER djaunty_dataset_facet_counts_delete AFTER DELETE
+            ON djaunty_dataset REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_facet_counts();
+
+        CREATE FUNCTION djaunty_keyword_facet_counts() RETURNS trigger as $$
+        begin
+            IF TG_OP = 'INSERT' THEN
+                {UPSERT.format(changes=KEYWORD_CHANGES.format(table='new_rows', delta=1))}
+            ELSE
+                {UPSERT.format(changes=KEYWORD_CHANGES.format(table='old_rows', delta=-1))}
+            END IF;
+
+            DELETE FROM djaunty_facetcount WHERE count <= 0;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_keyword_facet_counts_insert AFTER INSERT
+            ON djaunty_dataset_keywords REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_keyword_facet_counts();
+        CREATE TRIGGER djaunty_keyword_facet_counts_delete AFTER DELETE
+            ON djaunty_dataset_keywords REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_keyword_facet_counts();
+
+        CREATE FUNCTION djaunty_keyword_rename_facet_count() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_facetcount SET value = NEW.keyword
+            WHERE facet = 'keyword' AND value = OLD.keyword;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_keyword_rename_facet_count AFTER UPDATE OF keyword
+            ON djaunty_keyword FOR EACH ROW WHEN (OLD.keyword IS DISTINCT FROM NEW.keyword)
+            EXECUTE PROCEDURE djaunty_keyword_rename_facet_count();
+
+        -- Count the existing datasets
+        {UPSERT.format(changes=(
+            DATASET_CHANGES.format(table='djaunty_dataset', delta=1) + ' UNION ALL ' +
+            KEYWORD_CHANGES.format(table='djaunty_dataset_keywords', delta=1)
+        ))}
+    """
+
+    reverse_migration = """
+        DROP TRIGGER djaunty_keyword_rename_facet_count ON djaunty_keyword;
+        DROP FUNCTION djaunty_keyword_rename_facet_count;
+        DROP TRIGGER djaunty_keyword_facet_counts_insert ON djaunty_dataset_keywords;
+        DROP TRIGGER djaunty_keyword_facet_counts_delete ON djaunty_dataset_keywords;
+        DROP FUNCTION djaunty_keyword_facet_counts;
+        DROP TRIGGER djaunty_dataset_facet_counts_insert ON djaunty_dataset;
+        DROP TRIGGER djaunty_dataset_facet_counts_update ON djaunty_dataset;
+        DROP TRIGGER djaunty_dataset_facet_counts_delete ON djaunty_dataset;
+        DROP FUNCTION djaunty_dataset_facet_counts;
+    """
+
+    operations = [
+        migrations.RunSQL(migration, reverse_migration)
+    ]
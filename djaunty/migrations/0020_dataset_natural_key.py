@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:35
+
+from django.db import migrations
+
+# The natural key the index is built on, DJAUNTY_NATURAL_KEY has to name
+# the same columns.  A project using another key adds its own migration
+# replacing the index.
+NATURAL_KEY = ['path']
+
+# the number of duplicated keys listed when the index can't be built
+DUPLICATES_SHOWN = 20
+
+
+def check_duplicates(apps, schema_editor):
+    """Refuse to build the index over duplicated keys, listing some of them."""
+    key = [schema_editor.quote_name(column) for column in NATURAL_KEY]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {", ".join(key)}, array_agg(id ORDER BY id), count(*) OVER ()
+            FROM djaunty_dataset
+            WHERE {" AND ".join(f"{column} IS NOT NULL" for column in key)}
+            GROUP BY {", ".join(key)}
+            HAVING count(*) > 1
+            ORDER BY {", ".join(key)}
+            LIMIT {DUPLICATES_SHOWN}
+        """)
+        duplicates = cursor.fetchall()
+
+    if duplicates:
+        total = duplicates[0][-1]
+        listed = '\n'.join(
+            f'  {", ".join(map(str, row[:-2]))}: datasets {", ".join(map(str, row[-2]))}'
+            for row in duplicates
+        )
+        raise RuntimeError(
+            f'{total} values of the natural key ({", ".join(NATURAL_KEY)}) are shared by several '
+            f'datasets, the first {len(duplicates)}:\n{listed}\n'
+            'Delete or change the duplicated datasets, then migrate again.'
+        )
+
+
+def create_natural_key_index(apps, schema_editor):
+    check_duplicates(apps, schema_editor)
+
+    key = [schema_editor.quote_name(column) for column in NATURAL_KEY]
+    schema_editor.execute(
+        f'CREATE UNIQUE INDEX djaunty_dataset_natural_key ON djaunty_dataset ({", ".join(key)}) '
+        f'WHERE {" AND ".join(f"{column} IS NOT NULL" for column in key)}'
+    )
+
+
+def drop_natural_key_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX djaunty_dataset_natural_key')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0019_facet_count_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_natural_key_index, drop_natural_key_index)
+    ]
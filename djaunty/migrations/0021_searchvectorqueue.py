@@ -0,0 +1,230 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+# the columns the search vector is computed from
+SEARCH_COLUMNS = [
+    'genotype', 'lab', 'experimenter', 'species', 'identifier', 'session_description',
+    'experiment_description', 'institution', 'keyword_list', 'doi_list'
+]
+
+SEARCH_COLUMNS_CHANGED = '({old}) IS DISTINCT FROM ({new})'.format(
+    old=', '.join(f'o.{column}' for column in SEARCH_COLUMNS),
+    new=', '.join(f'n.{column}' for column in SEARCH_COLUMNS)
+)
+
+SEARCH_VECTOR = """
+    to_tsvector(coalesce({row}.genotype, '')) ||
+    to_tsvector(coalesce({row}.lab, '')) ||
+    to_tsvector(coalesce({row}.experimenter, '')) ||
+    to_tsvector(coalesce({row}.species, '')) ||
+    to_tsvector(coalesce({row}.identifier, '')) ||
+    to_tsvector(coalesce({row}.session_description, '')) ||
+    to_tsvector(coalesce({row}.experiment_description, '')) ||
+    to_tsvector(coalesce({row}.institution, '')) ||
+    to_tsvector(array_to_string({row}.keyword_list, ' ')) ||
+    to_tsvector(array_to_string({row}.doi_list, ' '))
+"""
+
+KEYWORD_LIST = """
+    ARRAY(
+        SELECT lower(k.keyword)
+        FROM djaunty_keyword k
+        JOIN djaunty_dataset_keywords dk ON dk.keyword_id = k.id
+        WHERE dk.dataset_id = djaunty_dataset.id
+        ORDER BY dk.id
+    )
+"""
+
+DOI_LIST = """
+    ARRAY(
+        SELECT lower(p.doi)
+        FROM djaunty_publication p
+        JOIN djaunty_dataset_related_publications dp ON dp.publication_id = p.id
+        WHERE dp.dataset_id = djaunty_dataset.id
+        ORDER BY dp.id
+    )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0020_dataset_natural_key'),
+    ]
+
+    migration = f"""
+        CREATE FUNCTION djaunty_search_vector(d djaunty_dataset) RETURNS tsvector as $$
+            SELECT {SEARCH_VECTOR.format(row='d')}
+        $$ LANGUAGE sql STABLE;
+
+        -- The row trigger no longer computes anything. Clients may write back
+        -- stale copies of the columns maintained by the database, so those are
+        -- kept unless the write comes from one of the triggers below or from
+        -- djaunty_refresh_search_vectors.
+        CREATE OR REPLACE FUNCTION djaunty_text_search_update() RETURNS trigger as $$
+        begin
+            IF TG_OP = 'UPDATE' AND pg_trigger_depth() = 1
+                    AND current_setting('djaunty.search_refresh', true) IS DISTINCT FROM 'on' THEN
+                NEW.keyword_list := OLD.keyword_list;
+                NEW.doi_list := OLD.doi_list;
+                NEW.search_vector := OLD.search_vector;
+            END IF;
+            return NEW;
+        end
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER djaunty_text_search_trigger ON djaunty_dataset;
+        CREATE TRIGGER djaunty_text_search_trigger BEFORE UPDATE
+            ON djaunty_dataset FOR EACH ROW EXECUTE PROCEDURE djaunty_text_search_update();
+
+        CREATE FUNCTION djaunty_search_vector_enqueue() RETURNS trigger as $$
+        begin
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO djaunty_searchvectorqueue (dataset_id)
+                SELECT id FROM new_rows
+                ON CONFLICT DO NOTHING;
+            ELSE
+                INSERT INTO djaunty_searchvectorqueue (dataset_id)
+                SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE {SEARCH_COLUMNS_CHANGED}
+                ON CONFLICT DO NOTHING;
+            END IF;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_search_vector_enqueue_insert AFTER INSERT
+            ON djaunty_dataset REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_search_vector_enqueue();
+        CREATE TRIGGER djaunty_search_vector_enqueue_update AFTER UPDATE
+            ON djaunty_dataset REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_search_vector_enqueue();
+
+        -- Link changes recompute only the affected array, once per statement;
+        -- the update above then queues the datasets.
+        CREATE OR REPLACE FUNCTION djaunty_dataset_links_update() RETURNS trigger as $$
+        begin
+            IF TG_TABLE_NAME = 'djaunty_dataset_keywords' THEN
+                UPDATE djaunty_dataset SET keyword_list = {KEYWORD_LIST}
+                WHERE id IN (SELECT dataset_id FROM changed_links);
+            ELSE
+                UPDATE djaunty_dataset SET doi_list = {DOI_LIST}
+                WHERE id IN (SELECT dataset_id FROM changed_links);
+            END IF;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION djaunty_keyword_rename() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET keyword_list = {KEYWORD_LIST}
+            WHERE id IN (
+                SELECT dataset_id FROM djaunty_dataset_keywords WHERE keyword_id = NEW.id
+            );
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION djaunty_publication_rename() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET doi_list = {DOI_LIST}
+            WHERE id IN (
+                SELECT dataset_id FROM djaunty_dataset_related_publications WHERE publication_id = NEW.id
+            );
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        -- Refresh the search vectors of up to batch_size queued datasets,
+        -- skipping the ones locked by concurrent workers. Returns the number
+        -- of datasets taken off the queue.
+        CREATE FUNCTION djaunty_refresh_search_vectors(batch_size integer) RETURNS integer as $$
+        declare
+            dequeued integer;
+        begin
+            PERFORM set_config('djaunty.search_refresh', 'on', true);
+
+            WITH batch AS (
+                DELETE FROM djaunty_searchvectorqueue
+                WHERE dataset_id IN (
+                    SELECT dataset_id FROM djaunty_searchvectorqueue
+                    ORDER BY dataset_id
+                    LIMIT batch_size
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING dataset_id
+            ), refreshed AS (
+                UPDATE djaunty_dataset d SET search_vector = djaunty_search_vector(d)
+                FROM batch WHERE d.id = batch.dataset_id
+            )
+            SELECT count(*) INTO dequeued FROM batch;
+
+            PERFORM set_config('djaunty.search_refresh', 'off', true);
+            return dequeued;
+        end
+        $$ LANGUAGE plpgsql;
+    """
+
+    reverse_migration = f"""
+        DROP FUNCTION djaunty_refresh_search_vectors;
+
+        DROP TRIGGER djaunty_search_vector_enqueue_insert ON djaunty_dataset;
+        DROP TRIGGER djaunty_search_vector_enqueue_update ON djaunty_dataset;
+        DROP FUNCTION djaunty_search_vector_enqueue;
+
+        CREATE OR REPLACE FUNCTION djaunty_dataset_links_update() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET id = id
+            WHERE id IN (SELECT dataset_id FROM changed_links);
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION djaunty_keyword_rename() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET id = id
+            WHERE id IN (
+                SELECT dataset_id FROM djaunty_dataset_keywords WHERE keyword_id = NEW.id
+            );
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION djaunty_publication_rename() RETURNS trigger as $$
+        begin
+            UPDATE djaunty_dataset SET id = id
+            WHERE id IN (
+                SELECT dataset_id FROM djaunty_dataset_related_publications WHERE publication_id = NEW.id
+            );
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE OR REPLACE FUNCTION djaunty_text_search_update() RETURNS trigger as $$
+        begin
+            NEW.keyword_list := {KEYWORD_LIST.replace('djaunty_dataset.id', 'NEW.id')};
+            NEW.doi_list := {DOI_LIST.replace('djaunty_dataset.id', 'NEW.id')};
+            NEW.search_vector := {SEARCH_VECTOR.format(row='NEW')};
+            return NEW;
+        end
+        $$ LANGUAGE plpgsql;
+
+        DROP TRIGGER djaunty_text_search_trigger ON djaunty_dataset;
+        CREATE TRIGGER djaunty_text_search_trigger BEFORE INSERT OR UPDATE
+            ON djaunty_dataset FOR EACH ROW EXECUTE PROCEDURE djaunty_text_search_update();
+
+        UPDATE djaunty_dataset SET id = id;
+
+        DROP FUNCTION djaunty_search_vector;
+    """
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchVectorQueue',
+            fields=[
+                ('dataset_id', models.IntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.RunSQL(migration, reverse_migration),
+    ]
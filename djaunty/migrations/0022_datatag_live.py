@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0021_searchvectorqueue'),
+    ]
+
+    # Queue the datasets whose columns changed while there are live tags,
+    # the search vector and timestamps can't change what a query matches.
+    migration = """
+        CREATE FUNCTION djaunty_datatag_enqueue() RETURNS trigger as $$
+        begin
+            IF NOT EXISTS (SELECT 1 FROM djaunty_datatag WHERE live) THEN
+                return NULL;
+            END IF;
+
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO djaunty_datatagqueue (dataset_id)
+                SELECT id FROM new_rows
+                ON CONFLICT DO NOTHING;
+            ELSE
+                INSERT INTO djaunty_datatagqueue (dataset_id)
+                SELECT n.id FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE to_jsonb(n) - 'search_vector' - 'updated'
+                    IS DISTINCT FROM to_jsonb(o) - 'search_vector' - 'updated'
+                ON CONFLICT DO NOTHING;
+            END IF;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_datatag_enqueue_insert AFTER INSERT
+            ON djaunty_dataset REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_datatag_enqueue();
+        CREATE TRIGGER djaunty_datatag_enqueue_update AFTER UPDATE
+            ON djaunty_dataset REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_datatag_enqueue();
+    """
+
+    reverse_migration = """
+        DROP TRIGGER djaunty_datatag_enqueue_insert ON djaunty_dataset;
+        DROP TRIGGER djaunty_datatag_enqueue_update ON djaunty_dataset;
+        DROP FUNCTION djaunty_datatag_enqueue;
+    """
+
+    operations = [
+        migrations.CreateModel(
+            name='DataTagQueue',
+            fields=[
+                ('dataset_id', models.IntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='datatag',
+            name='last_refreshed',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='datatag',
+            name='live',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='datatag',
+            name='query',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunSQL(migration, reverse_migration),
+    ]
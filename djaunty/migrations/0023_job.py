@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0022_datatag_live'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(null=True)),
+                ('finished', models.DateTimeField(null=True)),
+                ('kind', models.CharField(max_length=63)),
+                ('params', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=15)),
+                ('done', models.BigIntegerField(default=0)),
+                ('total', models.BigIntegerField(null=True)),
+                ('result', models.JSONField(null=True)),
+                ('error', models.TextField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='djaunty_job_status_34e43d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0023_job'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='keyword',
+            options={'ordering': ['keyword']},
+        ),
+        migrations.AlterModelOptions(
+            name='publication',
+            options={'ordering': ['doi']},
+        ),
+    ]
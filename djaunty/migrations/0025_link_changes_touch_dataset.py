@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:45
+
+from django.db import migrations
+
+KEYWORD_LIST = """
+    ARRAY(
+        SELECT lower(k.keyword)
+        FROM djaunty_keyword k
+        JOIN djaunty_dataset_keywords dk ON dk.keyword_id = k.id
+        WHERE dk.dataset_id = djaunty_dataset.id
+        ORDER BY dk.id
+    )
+"""
+
+DOI_LIST = """
+    ARRAY(
+        SELECT lower(p.doi)
+        FROM djaunty_publication p
+        JOIN djaunty_dataset_related_publications dp ON dp.publication_id = p.id
+        WHERE dp.dataset_id = djaunty_dataset.id
+        ORDER BY dp.id
+    )
+"""
+
+# the functions of migration 0021, with {touch} setting more columns
+LINK_FUNCTIONS = f"""
+    CREATE OR REPLACE FUNCTION djaunty_dataset_links_update() RETURNS trigger as $$
+    begin
+        IF TG_TABLE_NAME = 'djaunty_dataset_keywords' THEN
+            UPDATE djaunty_dataset SET keyword_list = {KEYWORD_LIST}{{touch}}
+            WHERE id IN (SELECT dataset_id FROM changed_links);
+        ELSE
+            UPDATE djaunty_dataset SET doi_list = {DOI_LIST}{{touch}}
+            WHERE id IN (SELECT dataset_id FROM changed_links);
+        END IF;
+        return NULL;
+    end
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION djaunty_keyword_rename() RETURNS trigger as $$
+    begin
+        UPDATE djaunty_dataset SET keyword_list = {KEYWORD_LIST}{{touch}}
+        WHERE id IN (
+            SELECT dataset_id FROM djaunty_dataset_keywords WHERE keyword_id = NEW.id
+        );
+        return NULL;
+    end
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION djaunty_publication_rename() RETURNS trigger as $$
+    begin
+        UPDATE djaunty_dataset SET doi_list = {DOI_LIST}{{touch}}
+        WHERE id IN (
+            SELECT dataset_id FROM djaunty_dataset_related_publications WHERE publication_id = NEW.id
+        );
+        return NULL;
+    end
+    $$ LANGUAGE plpgsql;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0024_keyword_publication_ordering'),
+    ]
+
+    # A dataset's keywords and publications are part of its representation,
+    # so changing them moves its updated time (and so its ETag) too.
+    operations = [
+        migrations.RunSQL(
+            LINK_FUNCTIONS.format(touch=', updated = now()'),
+            LINK_FUNCTIONS.format(touch='')
+        ),
+    ]
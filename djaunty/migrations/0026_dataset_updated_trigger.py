@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:50
+
+from django.db import migrations
+
+PRESERVE = """
+            IF TG_OP = 'UPDATE' AND pg_trigger_depth() = 1
+                    AND current_setting('djaunty.search_refresh', true) IS DISTINCT FROM 'on' THEN
+                NEW.keyword_list := OLD.keyword_list;
+                NEW.doi_list := OLD.doi_list;
+                NEW.search_vector := OLD.search_vector;
+            END IF;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0025_link_changes_touch_dataset'),
+    ]
+
+    # Cached representations are keyed by the updated time, so it must move
+    # on every change, including queryset updates bypassing auto_now.
+    migration = f"""
+        CREATE OR REPLACE FUNCTION djaunty_text_search_update() RETURNS trigger as $$
+        begin
+            {PRESERVE}
+
+            IF to_jsonb(NEW) - 'search_vector' - 'updated'
+                    IS DISTINCT FROM to_jsonb(OLD) - 'search_vector' - 'updated' THEN
+                NEW.updated := clock_timestamp();
+            END IF;
+            return NEW;
+        end
+        $$ LANGUAGE plpgsql;
+    """
+
+    reverse_migration = f"""
+        CREATE OR REPLACE FUNCTION djaunty_text_search_update() RETURNS trigger as $$
+        begin
+            {PRESERVE}
+            return NEW;
+        end
+        $$ LANGUAGE plpgsql;
+    """
+
+    operations = [
+        migrations.RunSQL(migration, reverse_migration),
+    ]
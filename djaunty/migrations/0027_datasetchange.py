@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+LOG = """
+    INSERT INTO djaunty_datasetchange (txid, created, dataset_id, operation, value)
+    SELECT txid_current(), clock_timestamp(), {columns}
+"""
+
+# columns that don't make a change of their own, link changes are logged
+# separately and the lists they update are derived from them
+IGNORED = "'{search_vector, updated, keyword_list, doi_list}'::text[]"
+
+LINK_CHANGES = {
+    'djaunty_dataset_keywords': ('keyword', 'djaunty_keyword', 'keyword_id', 'keyword'),
+    'djaunty_dataset_related_publications': ('publication', 'djaunty_publication', 'publication_id', 'doi'),
+}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0026_dataset_updated_trigger'),
+    ]
+
+    migration = f"""
+        CREATE FUNCTION djaunty_dataset_log_changes() RETURNS trigger as $$
+        begin
+            IF TG_OP = 'INSERT' THEN
+                {LOG.format(columns="id, 'insert', NULL FROM new_rows ORDER BY id")};
+            ELSIF TG_OP = 'DELETE' THEN
+                {LOG.format(columns="id, 'delete', NULL FROM old_rows ORDER BY id")};
+            ELSE
+                {LOG.format(columns="n.id, 'update', NULL FROM new_rows n JOIN old_rows o ON o.id = n.id")}
+                WHERE to_jsonb(n) - {IGNORED} IS DISTINCT FROM to_jsonb(o) - {IGNORED}
+                ORDER BY n.id;
+            END IF;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+    """ + ''.join(f"""
+        CREATE TRIGGER djaunty_dataset_log_{operation} AFTER {operation}
+            ON djaunty_dataset REFERENCING {tables}
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_dataset_log_changes();
+    """ for operation, tables in [
+        ('insert', 'NEW TABLE AS new_rows'),
+        ('update', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+        ('delete', 'OLD TABLE AS old_rows'),
+    ]) + ''.join(f"""
+        CREATE FUNCTION djaunty_{name}_log_changes() RETURNS trigger as $$
+        begin
+            IF TG_OP = 'INSERT' THEN
+                {LOG.format(columns=f"l.dataset_id, '{name}_added', t.{column} FROM new_rows l JOIN {table} t ON t.id = l.{key} ORDER BY l.id")};
+            ELSE
+                {LOG.format(columns=f"l.dataset_id, '{name}_removed', t.{column} FROM old_rows l JOIN {table} t ON t.id = l.{key} ORDER BY l.id")};
+            END IF;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER djaunty_{name}_log_insert AFTER INSERT
+            ON {links} REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_{name}_log_changes();
+        CREATE TRIGGER djaunty_{name}_log_delete AFTER DELETE
+            ON {links} REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_{name}_log_changes();
+    """ for links, (name, table, key, column) in LINK_CHANGES.items())
+
+    reverse_migration = ''.join(f"""
+        DROP TRIGGER djaunty_dataset_log_{operation} ON djaunty_dataset;
+    """ for operation in ['insert', 'update', 'delete']) + """
+        DROP FUNCTION djaunty_dataset_log_changes;
+    """ + ''.join(f"""
+        DROP TRIGGER djaunty_{name}_log_insert ON {links};
+        DROP TRIGGER djaunty_{name}_log_delete ON {links};
+        DROP FUNCTION djaunty_{name}_log_changes;
+    """ for links, (name, _, _, _) in LINK_CHANGES.items())
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('txid', models.BigIntegerField()),
+                ('created', models.DateTimeField()),
+                ('dataset_id', models.IntegerField()),
+                ('operation', models.CharField(max_length=31)),
+                ('value', models.CharField(max_length=255, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['txid', 'id'], name='djaunty_dat_txid_2cc383_idx')],
+            },
+        ),
+        migrations.RunSQL(migration, reverse_migration),
+    ]
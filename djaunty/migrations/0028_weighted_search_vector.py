@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:00
+
+from django.db import migrations
+
+# The columns of the search vector by weight, A ranks highest.  ts_rank_cd
+# reads the weights from the stored vector, so changing them only requires
+# rebuilding the vectors.
+SEARCH_WEIGHTS = {
+    'A': ["array_to_string({row}.keyword_list, ' ')", '{row}.experiment_description'],
+    'B': ['{row}.species', '{row}.genotype', '{row}.lab', '{row}.institution', '{row}.experimenter'],
+    'C': ['{row}.identifier', "array_to_string({row}.doi_list, ' ')"],
+    'D': ['{row}.session_description'],
+}
+
+WEIGHTED_SEARCH_VECTOR = ' ||\n'.join(
+    f"setweight(to_tsvector(coalesce({column}, '')), '{weight}')"
+    for weight, columns in SEARCH_WEIGHTS.items()
+    for column in columns
+)
+
+# as defined by migration 0021
+SEARCH_VECTOR = """
+    to_tsvector(coalesce({row}.genotype, '')) ||
+    to_tsvector(coalesce({row}.lab, '')) ||
+    to_tsvector(coalesce({row}.experimenter, '')) ||
+    to_tsvector(coalesce({row}.species, '')) ||
+    to_tsvector(coalesce({row}.identifier, '')) ||
+    to_tsvector(coalesce({row}.session_description, '')) ||
+    to_tsvector(coalesce({row}.experiment_description, '')) ||
+    to_tsvector(coalesce({row}.institution, '')) ||
+    to_tsvector(array_to_string({row}.keyword_list, ' ')) ||
+    to_tsvector(array_to_string({row}.doi_list, ' '))
+"""
+
+# the existing vectors are rebuilt by update_search_vectors (or reindex_search)
+ENQUEUE_ALL = """
+    INSERT INTO djaunty_searchvectorqueue (dataset_id)
+    SELECT id FROM djaunty_dataset
+    ON CONFLICT DO NOTHING;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0027_datasetchange'),
+    ]
+
+    migration = f"""
+        CREATE OR REPLACE FUNCTION djaunty_search_vector(d djaunty_dataset) RETURNS tsvector as $$
+            SELECT {WEIGHTED_SEARCH_VECTOR.format(row='d')}
+        $$ LANGUAGE sql STABLE;
+        {ENQUEUE_ALL}
+    """
+
+    reverse_migration = f"""
+        CREATE OR REPLACE FUNCTION djaunty_search_vector(d djaunty_dataset) RETURNS tsvector as $$
+            SELECT {SEARCH_VECTOR.format(row='d')}
+        $$ LANGUAGE sql STABLE;
+        {ENQUEUE_ALL}
+    """
+
+    operations = [
+        migrations.RunSQL(migration, reverse_migration)
+    ]
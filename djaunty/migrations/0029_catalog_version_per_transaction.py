@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:05
+
+from django.db import migrations
+
+# as defined by migration 0017
+CATALOG_TABLES = [
+    'djaunty_dataset',
+    'djaunty_keyword',
+    'djaunty_publication',
+    'djaunty_dataset_keywords',
+    'djaunty_dataset_related_publications',
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0028_weighted_search_vector'),
+    ]
+
+    # The version is bumped once per writing transaction, by its first
+    # statement on a catalog table, which also takes a shared advisory lock
+    # keyed by the sequence until the transaction ends.  Locks are released
+    # after the commit is visible, so while nobody holds the lock every
+    # version handed out stands for committed changes (see catalog.py).
+    migration = ''.join(f"""
+        DROP TRIGGER djaunty_catalog_version ON {table};
+    """ for table in CATALOG_TABLES) + """
+        CREATE OR REPLACE FUNCTION djaunty_catalog_version_bump() RETURNS trigger as $$
+        begin
+            IF current_setting('djaunty.catalog_written', true) IS DISTINCT FROM 'on' THEN
+                PERFORM pg_advisory_xact_lock_shared('djaunty_catalog_version'::regclass::oid::integer, 0);
+                PERFORM nextval('djaunty_catalog_version');
+                PERFORM set_config('djaunty.catalog_written', 'on', true);
+            END IF;
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+    """ + ''.join(f"""
+        CREATE TRIGGER djaunty_catalog_version AFTER INSERT OR UPDATE OR DELETE
+            ON {table} FOR EACH STATEMENT EXECUTE PROCEDURE djaunty_catalog_version_bump();
+    """ for table in CATALOG_TABLES)
+
+    reverse_migration = ''.join(f"""
+        DROP TRIGGER djaunty_catalog_version ON {table};
+    """ for table in CATALOG_TABLES) + """
+        CREATE OR REPLACE FUNCTION djaunty_catalog_version_bump() RETURNS trigger as $$
+        begin
+            PERFORM nextval('djaunty_catalog_version');
+            return NULL;
+        end
+        $$ LANGUAGE plpgsql;
+    """ + ''.join(f"""
+        CREATE CONSTRAINT TRIGGER djaunty_catalog_version AFTER INSERT OR UPDATE OR DELETE
+            ON {table} DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE PROCEDURE djaunty_catalog_version_bump();
+    """ for table in CATALOG_TABLES)
+
+    operations = [
+        migrations.RunSQL(migration, reverse_migration)
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0029_catalog_version_per_transaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datatag',
+            name='refresh_error',
+            field=models.TextField(editable=False, null=True),
+        ),
+    ]
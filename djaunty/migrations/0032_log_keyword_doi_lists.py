@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:20
+
+from django.db import migrations
+
+LOG = """
+    INSERT INTO djaunty_datasetchange (txid, created, dataset_id, operation, value)
+    SELECT txid_current(), clock_timestamp(), {columns}
+"""
+
+# Keyword and DOI renames only change the lists of the datasets, so those
+# are logged as updates too.  Link changes log an update besides their own
+# entries, as they change the lists.
+IGNORED = "'{search_vector, updated}'::text[]"
+
+# as defined by migration 0027
+PREVIOUSLY_IGNORED = "'{search_vector, updated, keyword_list, doi_list}'::text[]"
+
+LOG_CHANGES = """
+    CREATE OR REPLACE FUNCTION djaunty_dataset_log_changes() RETURNS trigger as $$
+    begin
+        IF TG_OP = 'INSERT' THEN
+            {insert};
+        ELSIF TG_OP = 'DELETE' THEN
+            {delete};
+        ELSE
+            {update}
+            WHERE to_jsonb(n) - {ignored} IS DISTINCT FROM to_jsonb(o) - {ignored}
+            ORDER BY n.id;
+        END IF;
+        return NULL;
+    end
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def log_changes(ignored):
+    return LOG_CHANGES.format(
+        insert=LOG.format(columns="id, 'insert', NULL FROM new_rows ORDER BY id"),
+        delete=LOG.format(columns="id, 'delete', NULL FROM old_rows ORDER BY id"),
+        update=LOG.format(columns="n.id, 'update', NULL FROM new_rows n JOIN old_rows o ON o.id = n.id"),
+        ignored=ignored
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0031_job_lease'),
+    ]
+
+    operations = [
+        migrations.RunSQL(log_changes(IGNORED), log_changes(PREVIOUSLY_IGNORED))
+    ]
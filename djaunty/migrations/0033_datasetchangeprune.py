@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0032_log_keyword_doi_lists'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetChangePrune',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pruned', models.DateTimeField(auto_now_add=True)),
+                ('txid', models.BigIntegerField()),
+                ('change_id', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:30
+
+from django.db import migrations
+
+# as defined by migration 0019
+FACET_COLUMNS = ['lab', 'institution', 'species', 'experimenter']
+
+FACET_VALUES = 'LATERAL (VALUES ' + ', '.join(
+    f"('{column}', {column})" for column in FACET_COLUMNS
+) + ') AS f(facet, value)'
+
+DATASET_CHANGES = f'SELECT f.facet, f.value, {{delta}} AS delta FROM {{table}}, {FACET_VALUES}'
+
+KEYWORD_CHANGES = """
+    SELECT 'keyword' AS facet, k.keyword AS value, {delta} AS delta
+    FROM {table} dk JOIN djaunty_keyword k ON k.id = dk.keyword_id
+"""
+
+UPSERT = """
+    INSERT INTO djaunty_facetcount (facet, value, count)
+    SELECT facet, value, sum(delta) FROM ({changes}) AS changes
+    WHERE value IS NOT NULL
+    GROUP BY facet, value
+    HAVING sum(delta) <> 0
+    ON CONFLICT (facet, value) DO UPDATE SET count = djaunty_facetcount.count + EXCLUDED.count
+"""
+
+# Only the values the statement brought down to zero are deleted, instead
+# of scanning the table for them.
+UPSERT_AND_PRUNE = """
+    WITH counted AS ({upsert} RETURNING facet, value, count)
+    SELECT array_agg(facet), array_agg(value) INTO emptied_facets, emptied_values
+    FROM counted WHERE count <= 0;
+
+    IF emptied_facets IS NOT NULL THEN
+        DELETE FROM djaunty_facetcount
+        WHERE (facet, value) IN (SELECT * FROM unnest(emptied_facets, emptied_values)) AND count <= 0;
+    END IF;
+"""
+
+UPSERT_AND_PRUNE_ALL = """
+    {upsert};
+    DELETE FROM djaunty_facetcount WHERE count <= 0;
+"""
+
+FUNCTIONS = """
+    CREATE OR REPLACE FUNCTION djaunty_dataset_facet_counts() RETURNS trigger as $$
+    declare
+        emptied_facets text[];
+        emptied_values text[];
+    begin
+        IF TG_OP = 'INSERT' THEN
+            {dataset_insert}
+        ELSIF TG_OP = 'DELETE' THEN
+            {dataset_delete}
+        ELSE
+            {dataset_update}
+        END IF;
+        return NULL;
+    end
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION djaunty_keyword_facet_counts() RETURNS trigger as $$
+    declare
+        emptied_facets text[];
+        emptied_values text[];
+    begin
+        IF TG_OP = 'INSERT' THEN
+            {keyword_insert}
+        ELSE
+            {keyword_delete}
+        END IF;
+        return NULL;
+    end
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def functions(statement):
+    def apply(changes):
+        return statement.format(upsert=UPSERT.format(changes=changes))
+
+    return FUNCTIONS.format(
+        dataset_insert=apply(DATASET_CHANGES.format(table='new_rows', delta=1)),
+        dataset_delete=apply(DATASET_CHANGES.format(table='old_rows', delta=-1)),
+        dataset_update=apply(
+            DATASET_CHANGES.format(table='new_rows', delta=1) + ' UNION ALL ' +
+            DATASET_CHANGES.format(table='old_rows', delta=-1)
+        ),
+        keyword_insert=apply(KEYWORD_CHANGES.format(table='new_rows', delta=1)),
+        keyword_delete=apply(KEYWORD_CHANGES.format(table='old_rows', delta=-1)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0033_datasetchangeprune'),
+    ]
+
+    operations = [
+        migrations.RunSQL(functions(UPSERT_AND_PRUNE), functions(UPSERT_AND_PRUNE_ALL))
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djaunty', '0034_facet_count_prune_touched'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='keyword',
+            options={},
+        ),
+        migrations.AlterModelOptions(
+            name='publication',
+            options={},
+        ),
+    ]
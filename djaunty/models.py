@@ -1,3 +1,4 @@
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.indexes import GinIndex
 from django.contrib.postgres.search import SearchVectorField
 from django.db import models
@@ -51,10 +52,44 @@ class Dataset(models.Model):
     number_of_units = models.IntegerField(null=True)
     nwb_version = models.CharField(max_length=MAX_CHAR_LENGTH, null=True)
 
+    # Refreshed in batches from SearchVectorQueue, see migration 0021
     search_vector = SearchVectorField(null=True, editable=False)
 
+    # Lower-cased copies of the related keywords and DOIs, maintained by
+    # database triggers, so that they can be filtered on without joins.
+    keyword_list = ArrayField(models.CharField(max_length=63), default=list, editable=False)
+    doi_list = ArrayField(models.CharField(max_length=MAX_CHAR_LENGTH), default=list, editable=False)
+
     class Meta:
-        indexes = [GinIndex(fields=['search_vector'])]
+        indexes = [
+            GinIndex(fields=['search_vector']),
+            GinIndex(fields=['keyword_list']),
+            GinIndex(fields=['doi_list'])
+        ]
+
+
+class FacetCount(models.Model):
+    """The number of datasets per value of a frequently used facet.
+
+    Rows are maintained by database triggers, see migration 0019.
+    """
+
+    facet = models.CharField(max_length=63)
+    value = models.CharField(max_length=MAX_CHAR_LENGTH)
+    count = models.BigIntegerField()
+
+    class Meta:
+        unique_together = [('facet', 'value')]
+
+
+class SearchVectorQueue(models.Model):
+    """Datasets whose search vector is out of date.
+
+    Rows are queued by database triggers and drained by idle run_workers
+    processes or the update_search_vectors command, see migration 0021.
+    """
+
+    dataset_id = models.IntegerField(primary_key=True)
 
 
 class DataTag(models.Model):
@@ -64,5 +99,109 @@ class DataTag(models.Model):
     name = models.CharField(max_length=MAX_CHAR_LENGTH, unique=True)
     datasets = models.ManyToManyField(Dataset, related_name='tags')
 
+    # The search query selecting the datasets, live tags keep following it
+    # as datasets change, the others are snapshots.
+    query = models.TextField(null=True)
+    live = models.BooleanField(default=False)
+    last_refreshed = models.DateTimeField(null=True, editable=False)
+
+    # Why the last refresh failed, e.g. the query outgrew the size limit.
+    # Live tags stop following their query when that happens.
+    refresh_error = models.TextField(null=True, editable=False)
+
     def __str__(self):
         return self.name
+
+
+class DataTagQueue(models.Model):
+    """Datasets changed since the live data tags were last refreshed.
+
+    Rows are queued by database triggers and drained by idle run_workers
+    processes or the refresh_datatags command, see migration 0022.
+    """
+
+    dataset_id = models.IntegerField(primary_key=True)
+
+
+class Job(models.Model):
+    """A long catalog operation run in the background by the run_workers command."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+
+    kind = models.CharField(max_length=63)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=15, choices=STATUSES, default=QUEUED)
+
+    # progress in the job's own unit, e.g. rows or datasets
+    done = models.BigIntegerField(default=0)
+    total = models.BigIntegerField(null=True)
+
+    result = models.JSONField(null=True)
+    error = models.TextField(null=True)
+
+    # A running job whose lease ran out lost its worker and is claimed again
+    lease_expires = models.DateTimeField(null=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'])
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk}'
+
+
+class DatasetChange(models.Model):
+    """A committed change to a dataset or its links, for the change feed.
+
+    Rows are written by database triggers, see migrations 0027 and 0032.
+    """
+
+    INSERT = 'insert'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    KEYWORD_ADDED = 'keyword_added'
+    KEYWORD_REMOVED = 'keyword_removed'
+    PUBLICATION_ADDED = 'publication_added'
+    PUBLICATION_REMOVED = 'publication_removed'
+
+    id = models.BigAutoField(primary_key=True)
+    # the id of the writing transaction, changes are read in (txid, id) order
+    txid = models.BigIntegerField()
+    created = models.DateTimeField()
+
+    dataset_id = models.IntegerField()
+    operation = models.CharField(max_length=31)
+    # the keyword or DOI of a link change
+    value = models.CharField(max_length=MAX_CHAR_LENGTH, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['txid', 'id'])
+        ]
+
+
+class DatasetChangePrune(models.Model):
+    """The last change deleted by a run of prune_changes.
+
+    Cursors before the latest one can't be followed any more, the changes
+    after them are gone.
+    """
+
+    pruned = models.DateTimeField(auto_now_add=True)
+    txid = models.BigIntegerField()
+    change_id = models.BigIntegerField()
@@ -0,0 +1,88 @@
+from django.db.models import Index
+
+from rest_framework import exceptions
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .counting import COUNT_STRATEGIES, CountingPaginator
+
+
+def indexed_fields(model):
+    """Return the names of the fields that lead a btree index on the model."""
+    fields = {field.name for field in model._meta.fields if field.db_index or field.unique}
+    fields.update(
+        index.fields[0].lstrip('-') for index in model._meta.indexes
+        if type(index) is Index
+    )
+    return fields
+
+
+class DatasetCursorPagination(CursorPagination):
+    """Keyset pagination, each page is an index range scan from the cursor."""
+
+    page_size = 25
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        field = ordering[0].lstrip('-')
+        allowed = indexed_fields(queryset.model)
+        if field not in allowed:
+            detail = f'Cursor pagination requires ordering by one of: {", ".join(sorted(allowed))}'
+            raise exceptions.ValidationError(detail=detail)
+        return ordering
+
+
+class DatasetPagination(PageNumberPagination):
+    """Page number pagination, or cursor pagination when a cursor is given.
+
+    Clients opt in to cursor pagination by passing an empty ``cursor`` for
+    the first page, and then follow the opaque next/previous links.
+
+    In page number mode the ``count`` parameter picks one of the count
+    strategies, see ``counting.count_queryset``, and the response tells
+    whether the returned count is exact.
+    """
+
+    page_size = 25
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    cursor_pagination_class = DatasetCursorPagination
+    count_query_param = 'count'
+
+    cursor_paginator = None
+    count_strategy = None
+
+    def django_paginator_class(self, object_list, per_page):
+        return CountingPaginator(object_list, per_page, count_strategy=self.count_strategy)
+
+    def get_count_strategy(self, request):
+        strategy = request.query_params.get(self.count_query_param)
+        if strategy is not None and strategy not in COUNT_STRATEGIES:
+            detail = f'Invalid count strategy, expected one of: {", ".join(COUNT_STRATEGIES)}'
+            raise exceptions.ValidationError(detail=detail)
+        return strategy
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+        self.cursor_paginator = None
+        self.count_strategy = self.get_count_strategy(request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+
+        response = super().get_paginated_response(data)
+        response.data['count_exact'] = self.page.paginator.count_exact
+        return response
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,79 @@
+from django.db.models import OuterRef
+from django.db.models.functions import Collate
+
+from rest_framework.relations import ManyRelatedField
+
+from .expressions import ArraySubquery
+from .models import Dataset
+from .serializers import DatasetSerializer
+
+# the keywords and DOIs sorted by code point like DatasetSerializer sorts
+# them, collected in the dataset query itself
+RELATED = {
+    'keywords': ArraySubquery(
+        Dataset.keywords.through.objects.filter(dataset_id=OuterRef('pk'))
+        .order_by(Collate('keyword__keyword', 'C')).values('keyword__keyword')
+    ),
+    'related_publications': ArraySubquery(
+        Dataset.related_publications.through.objects.filter(dataset_id=OuterRef('pk'))
+        .order_by(Collate('publication__doi', 'C')).values('publication__doi')
+    ),
+}
+
+# the fields of DatasetSerializer in order, and how to render the plain ones
+FIELDS = list(DatasetSerializer().fields.items())
+FIELD_NAMES = [name for name, _ in FIELDS]
+REPRESENT = {
+    name: field.to_representation
+    for name, field in FIELDS
+    if not isinstance(field, ManyRelatedField)
+}
+
+
+def select_fields(fields=None, exclude=None):
+    """Return the names of the fields to render, in the serializer's order.
+
+    Raises ValueError for names that aren't fields of DatasetSerializer.
+    """
+    unknown = (set(fields or []) | set(exclude or [])) - set(FIELD_NAMES)
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+
+    return [
+        name for name in FIELD_NAMES
+        if (not fields or name in fields) and name not in (exclude or [])
+    ]
+
+
+def dataset_values(queryset, fields=FIELD_NAMES):
+    """Select the columns of the given fields, as dicts, in a single query.
+
+    Keywords and DOIs are only collected when they are requested.
+    """
+    columns = [name for name in fields if name in REPRESENT]
+
+    # the pagination reads its position from the ordering columns
+    ordering = [name.lstrip('-') for name in queryset.query.order_by if isinstance(name, str)]
+    columns.extend(
+        name for name in ['id', *ordering]
+        if name in REPRESENT and name not in columns
+    )
+
+    related = {f'{name}_values': RELATED[name] for name in fields if name in RELATED}
+    return queryset.values(*columns, **related)
+
+
+def dataset_representation(row, fields=FIELD_NAMES):
+    """Render a row of ``dataset_values`` exactly like ``DatasetSerializer`` renders a dataset.
+
+    This skips building a model instance and looking up the attributes
+    of every field, which is most of the cost of serializing lists.
+    """
+    data = {}
+    for name in fields:
+        if name in RELATED:
+            data[name] = row[f'{name}_values']
+        else:
+            value = row[name]
+            data[name] = None if value is None else REPRESENT[name](value)
+    return data
@@ -0,0 +1,57 @@
+from django.conf import settings
+
+from rest_framework.renderers import JSONRenderer
+
+from .lru import LRUCache
+from .models import Dataset
+from .representation import dataset_representation, dataset_values
+
+# The number of encoded dataset representations kept in memory by each process
+ROW_CACHE_SIZE = getattr(settings, 'DJAUNTY_ROW_CACHE_SIZE', 10000)
+
+row_cache = LRUCache(ROW_CACHE_SIZE)
+
+_renderer = JSONRenderer()
+
+
+def encode(data):
+    """Encode like the JSON renderer of the API does."""
+    return _renderer.render(data)
+
+
+def dataset_fragments(rows, fields):
+    """Return the encoded representations of datasets given as {'id', 'updated'} rows.
+
+    A dataset's representation only changes along with its updated time
+    (see migrations 0025 and 0026), so fragments are cached by id and
+    updated, and only the missing ones are read and rendered.
+    """
+    fields = tuple(fields)
+    fragments = {}
+    missing = []
+    for row in rows:
+        fragment = row_cache.get((row['id'], row['updated'], fields))
+        if fragment is None:
+            missing.append(row['id'])
+        else:
+            fragments[row['id']] = fragment
+
+    if missing:
+        columns = fields if 'updated' in fields else (*fields, 'updated')
+        for row in dataset_values(Dataset.objects.filter(pk__in=missing), columns):
+            # rendered as it is now, should it have changed since the page was read
+            fragment = encode(dataset_representation(row, fields))
+            row_cache.set((row['id'], row['updated'], fields), fragment)
+            fragments[row['id']] = fragment
+
+    # datasets deleted since the page was read are left out
+    return [fragments[row['id']] for row in rows if row['id'] in fragments]
+
+
+def splice(data, fragments):
+    """Encode a paginated response body with its results given as encoded fragments."""
+    members = [
+        b'"results":[' + b','.join(fragments) + b']' if name == 'results' else encode({name: value})[1:-1]
+        for name, value in data.items()
+    ]
+    return b'{' + b','.join(members) + b'}'
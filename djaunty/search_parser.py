@@ -1,9 +1,21 @@
+import copy
+from contextlib import contextmanager
 import re
+import threading
 
+from django.conf import settings
 from django.db.models import F, Q
+from django.db.models.functions import Lower
 
 from ply import lex, yacc
 
+from .expressions import ArraySubquery
+from .lru import LRUCache
+from .models import Keyword, Publication
+
+
+_tables_lock = threading.Lock()
+
 
 class ParserException(Exception):
     pass
@@ -16,16 +28,45 @@ class BaseParser:
         'institution',
         'doi',
         'experimenter',
+        'species',
         'units',
         'electrodes'
     ]
 
+    aliases = {
+        'doi': 'related_publications__doi',
+        'keyword': 'keywords__keyword',
+        'electrodes': 'number_of_electrodes',
+        'units': 'number_of_units'
+    }
+
+    # tokens whose value, not just their type, changes the meaning of a query
+    valued_tokens = ['ATTRIBUTE', 'STRING', 'INTEGER']
+
     t_ignore_WHITESPACE = r'\s+'
     t_ignore_COMMENT = r'\#.*'
 
     def __init__(self, **kwargs):
-        self.lexer = lex.lex(module=self, reflags=re.IGNORECASE)
-        self.parser = yacc.yacc(module=self, write_tables=False, debug=False)
+        lexer, parser = self._tables()
+        self.lexer = lexer.clone()
+        self.parser = copy.copy(parser)
+
+    @classmethod
+    def _tables(cls):
+        """Return the lexer and parser prototypes shared by every instance.
+
+        Generating the LALR tables is by far the most expensive part of
+        creating a parser, so it happens once per class and process.  The
+        rule functions don't keep any state on the instance, so instances
+        only need their own (cheap) copies of the lexer and parser state.
+        """
+        if '_parser' not in cls.__dict__:
+            with _tables_lock:
+                if '_parser' not in cls.__dict__:
+                    module = object.__new__(cls)
+                    cls._lexer = lex.lex(module=module, reflags=re.IGNORECASE)
+                    cls._parser = yacc.yacc(module=module, write_tables=False, debug=False)
+        return cls._lexer, cls._parser
 
     def tokenize(self, text):
         self.lexer.input(text)
@@ -38,16 +79,25 @@ class BaseParser:
     def parse(self, text):
         return self.parser.parse(text, lexer=self.lexer)
 
+    def normalize(self, text):
+        """Return a canonical form of the text that parses to the same result.
+
+        Whitespace, comments, the case of keywords and attribute aliases
+        don't change the meaning of a query, so they are erased here.
+        """
+        self.lexer.input(text)
+        normalized = []
+        for token in iter(self.lexer.token, None):
+            if token.type in self.valued_tokens:
+                normalized.append(f'{token.type}:{token.value!r}')
+            else:
+                normalized.append(token.type)
+        return ' '.join(normalized)
+
     @lex.TOKEN('(' + ')|('.join(attributes) + ')')
     def t_ATTRIBUTE(self, t):
-        if t.value == 'doi':
-            t.value = 'related_publications__doi'
-        elif t.value == 'keyword':
-            t.value = 'keywords__keyword'
-        elif t.value == 'electrodes':
-            t.value = 'number_of_electrodes'
-        elif t.value == 'units':
-            t.value = 'number_of_units'
+        value = t.value.lower()
+        t.value = self.aliases.get(value, value)
         return t
 
     def t_error(self, t):
@@ -92,6 +142,13 @@ class SearchParser(BaseParser):
     t_NOT = r'not'
     t_NULL = r'null'
 
+    # Related values that are also stored as lower-cased arrays on the
+    # dataset.  Matching those avoids a join (and duplicate rows) per rule.
+    array_attributes = {
+        'keywords__keyword': ('keyword_list', Keyword, 'keyword'),
+        'related_publications__doi': ('doi_list', Publication, 'doi')
+    }
+
     # for the parser
     precedence = [
         ('left', 'OR'),
@@ -112,7 +169,7 @@ class SearchParser(BaseParser):
 
     @lex.TOKEN('(' + ')|('.join(binary_operators.keys()) + ')')
     def t_BINARYOP(self, t):
-        value = t.value.replace('>', r'\>')
+        value = t.value.lower().replace('>', r'\>')
         value = value.replace('<', r'\<')
         t.type = self.binary_operators[value]
         return t
@@ -163,7 +220,19 @@ class SearchParser(BaseParser):
         key = p[1]
         op = p[2]
         value = p[3]
-        if op in ('=', '!=') and isinstance(value, str):
+        if key in self.array_attributes and op in ('=', '!=', '~='):
+            column, model, field = self.array_attributes[key]
+            value = str(value).lower()
+            if op == '~=':
+                # search the (small) related table, then match any of the
+                # results through the array index
+                key = column + '__overlap'
+                matches = model.objects.filter(**{field + '__icontains': value})
+                value = ArraySubquery(matches.values(value=Lower(field)))
+            else:
+                key = column + '__contains'
+                value = [value]
+        elif op in ('=', '!=') and isinstance(value, str):
             key = key + '__iexact'
         elif op == '<':
             key = key + '__lt'
@@ -184,14 +253,21 @@ class SearchParser(BaseParser):
 
     def p_rule_is_null(self, p):
         '''rule : ATTRIBUTE EQUAL NULL'''
-        key = p[1] + '__isnull'
-        kwargs = dict([(key, True)])
+        if p[1] in self.array_attributes:
+            kwargs = dict([(self.array_attributes[p[1]][0], [])])
+        else:
+            key = p[1] + '__isnull'
+            kwargs = dict([(key, True)])
         p[0] = Q(**kwargs)
 
     def p_rule_in(self, p):
         "rule : ATTRIBUTE IN '[' list ']'"
-        key = p[1] + '__in'
-        value = p[4]
+        if p[1] in self.array_attributes:
+            key = self.array_attributes[p[1]][0] + '__overlap'
+            value = [str(v).lower() for v in p[4]]
+        else:
+            key = p[1] + '__in'
+            value = p[4]
         kwargs = dict([(key, value)])
         p[0] = Q(**kwargs)
 
@@ -212,11 +288,131 @@ class SearchParser(BaseParser):
         p[0] = p[1]
 
 
+class Histogram:
+    """A facet counting the values of an attribute in ranges."""
+
+    scales = ['linear', 'log', 'quantile']
+
+    def __init__(self, name, bins, scale='linear'):
+        self.name = name
+        self.bins = bins
+        self.scale = scale
+
+    def __repr__(self):
+        return f'Histogram({self.name!r}, {self.bins}, {self.scale!r})'
+
+
 class FacetParser(BaseParser):
+    # attributes that can be faceted but not searched on
+    range_attributes = [
+        'size',
+        'age',
+        'session_start_time',
+        'date_of_birth'
+    ]
+
+    # attributes that can be bucketed in ranges
+    numeric_attributes = [
+        'number_of_units',
+        'number_of_electrodes'
+    ] + range_attributes
+
+    max_bins = 1000
+
     tokens = [
-        'ATTRIBUTE'
+        'ATTRIBUTE',
+        'RANGE_ATTRIBUTE',
+        'BINS',
+        'NUMBER',
+        'SCALE'
     ]
 
+    valued_tokens = BaseParser.valued_tokens + ['RANGE_ATTRIBUTE', 'NUMBER', 'SCALE']
+
+    t_BINS = r'bins'
+    t_NUMBER = r'\d+'
+
+    @lex.TOKEN('(' + ')|('.join(range_attributes) + ')')
+    def t_RANGE_ATTRIBUTE(self, t):
+        t.value = t.value.lower()
+        return t
+
+    @lex.TOKEN('|'.join(Histogram.scales))
+    def t_SCALE(self, t):
+        t.value = t.value.lower()
+        return t
+
     def p_facet(self, p):
-        'facet : ATTRIBUTE'
+        'facet : attribute'
         p[0] = F(p[1])
+
+    def p_facet_histogram(self, p):
+        '''facet : attribute BINS NUMBER
+                 | attribute BINS NUMBER SCALE
+        '''
+        if p[1] not in self.numeric_attributes:
+            raise ParserException(f'Cannot compute a histogram of "{p[1]}"')
+
+        bins = int(p[3])
+        if not 0 < bins <= self.max_bins:
+            raise ParserException(f'The number of bins must be between 1 and {self.max_bins}')
+
+        scale = p[4] if len(p) == 5 else 'linear'
+        p[0] = Histogram(p[1], bins, scale)
+
+    def p_attribute(self, p):
+        '''attribute : ATTRIBUTE
+                     | RANGE_ATTRIBUTE
+        '''
+        p[0] = p[1]
+
+
+class ParserPool:
+    """A thread-safe pool of parser instances sharing one set of tables.
+
+    Parse results are cached by normalized query text, see
+    ``BaseParser.normalize``.
+    """
+
+    def __init__(self, parser_class, size=16, cache_size=1024):
+        self.parser_class = parser_class
+        self.size = size
+        self.cache = LRUCache(cache_size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            parser = self._idle.pop() if self._idle else None
+
+        if parser is None:
+            parser = self.parser_class()
+
+        try:
+            yield parser
+        finally:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append(parser)
+
+    def normalize(self, text):
+        with self.acquire() as parser:
+            return parser.normalize(text)
+
+    def parse(self, text):
+        with self.acquire() as parser:
+            key = parser.normalize(text)
+            result = self.cache.get(key)
+            if result is None:
+                result = parser.parse(text)
+                self.cache.set(key, result)
+
+        # callers are free to mutate what they get back (e.g. ``Q.negate``)
+        return copy.deepcopy(result)
+
+
+QUERY_CACHE_SIZE = getattr(settings, 'DJAUNTY_QUERY_CACHE_SIZE', 1024)
+
+search_parsers = ParserPool(SearchParser, cache_size=QUERY_CACHE_SIZE)
+facet_parsers = ParserPool(FacetParser, cache_size=QUERY_CACHE_SIZE)
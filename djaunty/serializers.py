@@ -1,7 +1,13 @@
+from collections.abc import Mapping
+
+from django.db import transaction
+
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
-from .models import DataTag, Dataset, Keyword, Publication
-from .search_parser import FacetParser, ParserException, SearchParser
+from .datatags import TOO_MANY_DATASETS, DataTagTooLarge, refresh_datatag, too_many_datasets
+from .models import DataTag, Dataset, DatasetChange, Job, Keyword, MAX_CHAR_LENGTH, Publication
+from .search_parser import Histogram, ParserException, facet_parsers, search_parsers
 
 
 class AgeField(serializers.DurationField):
@@ -21,11 +27,10 @@ class QueryField(serializers.CharField):
         raise Exception('A query can only be used as a "write-only" field.')
 
     def to_internal_value(self, data):
-        parser = SearchParser()
         value = super().to_internal_value(data)
 
         try:
-            return parser.parse(value)
+            return search_parsers.parse(value)
         except ParserException as e:
             raise serializers.ValidationError(str(e))
 
@@ -35,19 +40,39 @@ class FacetField(serializers.CharField):
         raise Exception('A facet can only be used as a "write-only" field.')
 
     def to_internal_value(self, data):
-        parser = FacetParser()
         value = super().to_internal_value(data)
 
         try:
-            return parser.parse(value)
+            return facet_parsers.parse(value)
         except ParserException as e:
             raise serializers.ValidationError(str(e))
 
 
+class SortedManyRelatedField(serializers.ManyRelatedField):
+    def to_representation(self, iterable):
+        return sorted(super().to_representation(iterable))
+
+
+class SortedSlugRelatedField(serializers.SlugRelatedField):
+    """A slug field whose many form lists the slugs sorted by code point.
+
+    The values read path (see representation.py) sorts them the same way
+    in SQL, with the "C" collation.
+    """
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return SortedManyRelatedField(**list_kwargs)
+
+
 class DatasetSerializer(serializers.ModelSerializer):
-    related_publications = serializers.SlugRelatedField(
+    related_publications = SortedSlugRelatedField(
         many=True, slug_field='doi', read_only=False, queryset=Publication.objects.all())
-    keywords = serializers.SlugRelatedField(
+    keywords = SortedSlugRelatedField(
         many=True, slug_field='keyword', read_only=False, queryset=Keyword.objects.all())
 
     age = AgeField(required=False, allow_null=True)
@@ -64,18 +89,20 @@ class DatasetSerializer(serializers.ModelSerializer):
         ]
 
     def to_internal_value(self, data):
-        keywords = []
-        publications = []
+        if not isinstance(data, Mapping):
+            return super().to_internal_value(data)
 
-        for keyword in data.pop('keywords', []):
-            keywords.append(
-                Keyword.objects.get_or_create(keyword=keyword)[0]
-            )
+        keywords = self.validate_names('keywords', data.pop('keywords', []), 63)
+        publications = self.validate_names('related_publications', data.pop('related_publications', []))
 
-        for doi in data.pop('related_publications', []):
-            publications.append(
-                Publication.objects.get_or_create(doi=doi)[0]
-            )
+        # bulk ingestion resolves the names of all rows at once
+        if not self.context.get('defer_relations'):
+            keywords = [
+                Keyword.objects.get_or_create(keyword=keyword)[0] for keyword in keywords
+            ]
+            publications = [
+                Publication.objects.get_or_create(doi=doi)[0] for doi in publications
+            ]
 
         data['keywords'] = []
         data['related_publications'] = []
@@ -86,10 +113,31 @@ class DatasetSerializer(serializers.ModelSerializer):
 
         return data
 
+    def validate_names(self, field_name, names, max_length=MAX_CHAR_LENGTH):
+        field = serializers.ListField(child=serializers.CharField(max_length=max_length))
+        try:
+            return field.run_validation(names)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({field_name: e.detail})
+
 
 class DatasetFacetSerializer(serializers.Serializer):
-    facet = FacetField(write_only=True, required=True)
+    facet = FacetField(write_only=True, required=False)
+    facets = serializers.ListField(child=FacetField(), write_only=True, required=False)
+    path = serializers.ListField(child=FacetField(), write_only=True, required=False)
     query = QueryField(write_only=True, required=False)
+    approximate = serializers.BooleanField(write_only=True, required=False)
+
+    def validate(self, data):
+        if not any(data.get(key) for key in ('facet', 'facets', 'path')):
+            raise serializers.ValidationError('One of facet, facets or path is required.')
+
+        histograms = data.get('facets', []) + data.get('path', [])
+        if any(isinstance(facet, Histogram) for facet in histograms):
+            raise serializers.ValidationError('Histograms can only be requested as a single facet.')
+        if isinstance(data.get('facet'), Histogram) and data.get('approximate'):
+            raise serializers.ValidationError('Histograms are only counted exactly.')
+        return data
 
 
 class DataTagSerializer(serializers.ModelSerializer):
@@ -97,34 +145,51 @@ class DataTagSerializer(serializers.ModelSerializer):
         many=True, read_only=True, view_name='dataset-detail'
     )
 
-    # The query can match a huge number of datasets and possibly kill the
-    # server, should we have a limit in place and return a 400 if the
-    # result set is too large?
-    query = QueryField(write_only=True, required=True)
+    query = serializers.CharField(required=True)
 
     class Meta:
         model = DataTag
-        fields = ['id', 'created', 'updated', 'datasets', 'name', 'query']
+        fields = [
+            'id', 'created', 'updated', 'datasets', 'name', 'query', 'live', 'last_refreshed', 'refresh_error'
+        ]
 
-    def create(self, data):
-        query = data.pop('query')
-        datatag = super().create(data)
+    def validate_query(self, text):
+        try:
+            query = search_parsers.parse(text)
+        except ParserException as e:
+            raise serializers.ValidationError(str(e))
 
-        for dataset in Dataset.objects.filter(query).values('pk').all():
-            datatag.datasets.add(dataset['pk'])
+        # deferred refreshes are checked by the job, see refresh_datatag
+        if not self.context.get('defer_refresh') and too_many_datasets(query):
+            raise serializers.ValidationError(TOO_MANY_DATASETS)
+        return text
 
-        return datatag
+    def refresh(self, datatag):
+        try:
+            refresh_datatag(datatag)
+        except DataTagTooLarge as e:  # grew since the query was validated
+            raise serializers.ValidationError({'query': [str(e)]})
 
-    def update(self, datatag, data):
-        query = data.pop('query', None)
-        datatag = super().update(datatag, data)
+    # whether the membership of the saved tag needs a refresh, which is
+    # left to the caller with the defer_refresh context
+    needs_refresh = False
 
-        if query is None:
-            return datatag
+    def create(self, data):
+        self.needs_refresh = True
+        with transaction.atomic():
+            datatag = super().create(data)
+            if not self.context.get('defer_refresh'):
+                self.refresh(datatag)
 
-        datatag.datasets.clear()
-        for dataset in Dataset.objects.filter(query).values('pk').all():
-            datatag.datasets.add(dataset['pk'])
+        return datatag
+
+    def update(self, datatag, data):
+        # a tag turning live may have missed changes while it was a snapshot
+        self.needs_refresh = 'query' in data or bool(data.get('live') and not datatag.live)
+        with transaction.atomic():
+            datatag = super().update(datatag, data)
+            if self.needs_refresh and not self.context.get('defer_refresh'):
+                self.refresh(datatag)
 
         return datatag
 
@@ -132,4 +197,47 @@ class DataTagSerializer(serializers.ModelSerializer):
 class DataTagListSerializer(serializers.ModelSerializer):
     class Meta:
         model = DataTag
-        fields = ['id', 'created', 'updated', 'name']
+        fields = ['id', 'created', 'updated', 'name', 'live', 'last_refreshed', 'refresh_error']
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'kind', 'status', 'created', 'started', 'finished', 'done', 'total', 'result', 'error',
+            'attempts'
+        ]
+
+
+class DatasetChangeSerializer(serializers.ModelSerializer):
+    dataset = serializers.IntegerField(source='dataset_id')
+
+    class Meta:
+        model = DatasetChange
+        fields = ['created', 'operation', 'dataset', 'value']
+
+
+class DatasetBulkSerializer(serializers.Serializer):
+    query = QueryField(write_only=True, required=True)
+    patch = serializers.DictField(write_only=True, required=False)
+    dry_run = serializers.BooleanField(write_only=True, default=False)
+
+    def validate_patch(self, patch):
+        # a patch can't give many datasets the same natural key
+        writable = {name for name, field in DatasetSerializer().fields.items() if not field.read_only}
+        invalid = set(patch) - (writable - set(self.context.get('natural_key', [])))
+        if invalid:
+            raise serializers.ValidationError(
+                f'These fields can\'t be patched: {", ".join(sorted(invalid))}'
+            )
+
+        serializer = DatasetSerializer(
+            data=dict(patch), partial=True, context={'defer_relations': True}
+        )
+        serializer.is_valid(raise_exception=True)
+
+        # the serializer defaults missing names to empty lists, don't clear those
+        return {
+            name: value for name, value in serializer.validated_data.items()
+            if name in patch
+        }
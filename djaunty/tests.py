@@ -1,3 +1,458 @@
-from django.test import TestCase
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.http import QueryDict
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 
-# Create your tests here.
+from rest_framework.test import APIClient
+
+from .changes import MAX_ID, decode_cursor, encode_cursor
+from .facets import expected_facet_counts, facet_request_key, grouping_sets
+from .ingest import KEY_TAKEN, ingest_rows, sync_links, upsert_datasets, validate_rows
+from .lru import LRUCache
+from .models import Dataset, FacetCount, Keyword
+from .representation import FIELD_NAMES, dataset_representation, dataset_values, select_fields
+from .search_parser import FacetParser, ParserPool, SearchParser
+from .serializers import DatasetFacetSerializer, DatasetSerializer
+
+
+class ParserPoolTests(SimpleTestCase):
+    def test_parsers_share_tables(self):
+        first, second = SearchParser(), SearchParser()
+        self.assertIsNot(first.parser, second.parser)
+        self.assertIs(first.parser.action, second.parser.action)
+        self.assertIsNot(first.lexer, second.lexer)
+
+        # the tables are per class
+        self.assertIsNot(FacetParser().parser.action, first.parser.action)
+
+    def test_reuses_idle_parsers(self):
+        pool = ParserPool(SearchParser)
+        with pool.acquire() as first:
+            with pool.acquire() as second:
+                self.assertIsNot(first, second)
+
+        with pool.acquire() as parser:
+            self.assertIn(parser, (first, second))
+
+    def test_keeps_at_most_size_idle_parsers(self):
+        pool = ParserPool(SearchParser, size=1)
+        with pool.acquire(), pool.acquire():
+            pass
+        self.assertEqual(len(pool._idle), 1)
+
+    def test_returns_parsers_after_errors(self):
+        pool = ParserPool(SearchParser, size=1)
+        with self.assertRaises(RuntimeError):
+            with pool.acquire() as parser:
+                raise RuntimeError()
+        self.assertEqual(pool._idle, [parser])
+
+    def test_caches_parses_by_normalized_text(self):
+        pool = ParserPool(SearchParser)
+        first = pool.parse('lab = "x"')
+        second = pool.parse('LAB="x"  # a comment')
+        self.assertEqual(first, second)
+        self.assertEqual(pool.cache.stats()['hits'], 1)
+
+    def test_returns_copies_of_cached_parses(self):
+        pool = ParserPool(SearchParser)
+        pool.parse('lab = "x"').negate()
+        self.assertEqual(pool.parse('lab = "x"'), Q(lab__iexact='x'))
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        self.assertEqual(cache.stats(), {'size': 1, 'maxsize': 2, 'hits': 1, 'misses': 1})
+
+    def test_zero_size_caches_nothing(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class NormalizeTests(SimpleTestCase):
+    def assertSameQuery(self, parser, first, second):
+        self.assertEqual(parser.normalize(first), parser.normalize(second))
+        self.assertEqual(repr(parser.parse(first)), repr(parser.parse(second)))
+
+    def assertDifferentQuery(self, parser, first, second):
+        self.assertNotEqual(parser.normalize(first), parser.normalize(second))
+
+    def test_erases_whitespace_comments_and_case(self):
+        parser = SearchParser()
+        self.assertSameQuery(parser, 'lab = "x" and units > 5', 'LAB="x"   and\n units>5 # comment')
+        self.assertSameQuery(parser, 'lab = "x" and units > 5', 'LAB="x" AND units > 5')
+        self.assertSameQuery(parser, 'lab in ["a"] or not lab = null', 'lab IN ["a"] OR NOT lab = NULL')
+
+    def test_resolves_aliases(self):
+        parser = SearchParser()
+        self.assertEqual(parser.normalize('units > 5'), parser.normalize('UNITS > 5'))
+        self.assertIn("'number_of_units'", parser.normalize('units > 5'))
+
+    def test_keeps_values(self):
+        parser = SearchParser()
+        self.assertDifferentQuery(parser, 'lab = "x"', 'lab = "X"')
+        self.assertDifferentQuery(parser, 'lab = "x"', "lab = 'y'")
+        self.assertDifferentQuery(parser, 'units > 5', 'units > 6')
+        self.assertDifferentQuery(parser, 'units > 5', 'units < 5')
+        self.assertDifferentQuery(parser, 'lab = "x"', 'institution = "x"')
+
+    def test_keeps_facet_values(self):
+        parser = FacetParser()
+        self.assertSameQuery(parser, 'size bins 5 log', 'SIZE  bins 5 LOG')
+        self.assertDifferentQuery(parser, 'size bins 5 log', 'size bins 6 log')
+        self.assertDifferentQuery(parser, 'size bins 5 log', 'age bins 5 log')
+        self.assertDifferentQuery(parser, 'size bins 5 log', 'size bins 5')
+
+
+class GroupingSetsTests(SimpleTestCase):
+    def test_facets(self):
+        self.assertEqual(grouping_sets(['lab', 'species'], []), [(0,), (1,)])
+
+    def test_path(self):
+        self.assertEqual(grouping_sets([], ['lab', 'species', 'units']), [(0,), (0, 1), (0, 1, 2)])
+
+    def test_facets_and_path(self):
+        self.assertEqual(
+            grouping_sets(['lab', 'species'], ['institution', 'lab']),
+            [(0,), (1,), (2,), (2, 3)]
+        )
+
+
+class FacetRequestKeyTests(SimpleTestCase):
+    def key(self, data):
+        serializer = DatasetFacetSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return facet_request_key(serializer.validated_data)
+
+    def test_equivalent_requests(self):
+        self.assertEqual(
+            self.key({'facets': ['lab'], 'query': 'units > 5', 'approximate': False}),
+            self.key({'facets': ['LAB'], 'query': 'units>5  # comment'})
+        )
+        self.assertEqual(
+            self.key({'facet': 'lab', 'approximate': 'true'}),
+            self.key({'facet': 'lab', 'approximate': True})
+        )
+
+    def test_approximate(self):
+        self.assertNotEqual(
+            self.key({'facet': 'lab', 'approximate': 'false'}),
+            self.key({'facet': 'lab', 'approximate': 'true'})
+        )
+        self.assertEqual(
+            self.key({'facet': 'lab', 'approximate': 'false'}),
+            self.key({'facet': 'lab'})
+        )
+
+    def test_form_encoded_lists(self):
+        self.assertNotEqual(
+            self.key(QueryDict('facets=lab&facets=species')),
+            self.key(QueryDict('facets=lab'))
+        )
+        self.assertEqual(
+            self.key(QueryDict('facets=lab&facets=species')),
+            self.key({'facets': ['lab', 'species']})
+        )
+
+    def test_facets_and_path_differ(self):
+        self.assertNotEqual(self.key({'facets': ['lab']}), self.key({'path': ['lab']}))
+        self.assertNotEqual(self.key({'facets': ['lab']}), self.key({'facet': 'lab'}))
+        self.assertNotEqual(
+            self.key({'path': ['lab', 'species']}),
+            self.key({'path': ['species', 'lab']})
+        )
+
+    def test_queries_differ(self):
+        self.assertNotEqual(
+            self.key({'facet': 'lab', 'query': 'units > 5'}),
+            self.key({'facet': 'lab', 'query': 'units > 6'})
+        )
+        self.assertNotEqual(
+            self.key({'facet': 'lab', 'query': 'units > 5'}),
+            self.key({'facet': 'lab'})
+        )
+
+
+class DatasetFacetSerializerTests(SimpleTestCase):
+    def test_exact_histograms(self):
+        serializer = DatasetFacetSerializer(data={'facet': 'size bins 5', 'approximate': True})
+        self.assertFalse(serializer.is_valid())
+        self.assertTrue(DatasetFacetSerializer(data={'facet': 'size bins 5', 'approximate': False}).is_valid())
+        self.assertTrue(DatasetFacetSerializer(data={'facet': 'lab', 'approximate': True}).is_valid())
+
+
+class SelectFieldsTests(SimpleTestCase):
+    def test_all_fields(self):
+        self.assertEqual(select_fields(), FIELD_NAMES)
+        self.assertEqual(select_fields([], []), FIELD_NAMES)
+
+    def test_fields_in_serializer_order(self):
+        self.assertEqual(select_fields(['lab', 'keywords', 'id']), ['id', 'keywords', 'lab'])
+
+    def test_exclude(self):
+        excluded = ['keywords', 'related_publications']
+        self.assertEqual(
+            select_fields(exclude=excluded),
+            [name for name in FIELD_NAMES if name not in excluded]
+        )
+        self.assertEqual(select_fields(['id', 'lab'], ['lab']), ['id'])
+
+    def test_unknown_fields(self):
+        with self.assertRaisesMessage(ValueError, 'Unknown fields: bogus, other'):
+            select_fields(['id', 'other'], ['bogus'])
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        for txid, id in [(0, 0), (12, 345), (2 ** 40, MAX_ID)]:
+            self.assertEqual(decode_cursor(encode_cursor(txid, id)), (txid, id))
+
+    def test_url_safe(self):
+        cursor = encode_cursor(2 ** 40, MAX_ID)
+        self.assertRegex(cursor, r'^[A-Za-z0-9_=-]+$')
+
+    def test_invalid_cursors(self):
+        for cursor in ['', 'garbage', 'é', '__4=', 'MTp4', 'MToyOjM=']:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+def dataset_row(path, **fields):
+    return {'path': path, 'size': 1, 'keywords': [], 'related_publications': [], **fields}
+
+
+class IngestTests(TestCase):
+    def links(self, dataset_id):
+        dataset = Dataset.objects.get(pk=dataset_id)
+        return (
+            sorted(dataset.keywords.values_list('keyword', flat=True)),
+            sorted(dataset.related_publications.values_list('doi', flat=True))
+        )
+
+    def test_ingest_rows(self):
+        ids, errors = ingest_rows([
+            dataset_row('a', keywords=['x', 'y'], related_publications=['10.1/a']),
+            dataset_row('b', size='big'),
+            dataset_row('c', keywords=['y'])
+        ])
+        self.assertEqual([Dataset.objects.get(pk=pk).path for pk in ids], ['a', 'c'])
+        self.assertEqual(self.links(ids[0]), (['x', 'y'], ['10.1/a']))
+        self.assertEqual(self.links(ids[1]), (['y'], []))
+        self.assertEqual([error['index'] for error in errors], [1])
+        self.assertIn('size', errors[0]['errors'])
+
+    def test_ingest_skips_taken_keys(self):
+        ingest_rows([dataset_row('a')])
+        ids, errors = ingest_rows([
+            dataset_row('b', keywords=['b']),
+            dataset_row('a', keywords=['a']),
+            dataset_row('c', keywords=['c']),
+            dataset_row('c', keywords=['d'])
+        ], offset=10)
+
+        # the returned ids are matched to their rows around the skipped ones
+        self.assertEqual([Dataset.objects.get(pk=pk).path for pk in ids], ['b', 'c'])
+        self.assertEqual([self.links(pk)[0] for pk in ids], [['b'], ['c']])
+        self.assertEqual(errors, [
+            {'index': 11, 'errors': {'path': [KEY_TAKEN]}},
+            {'index': 13, 'errors': {'path': [KEY_TAKEN]}}
+        ])
+        self.assertEqual(Dataset.objects.filter(path='a').get().keywords.count(), 0)
+
+    def test_upsert(self):
+        rows, errors = validate_rows([
+            dataset_row('a', lab='one', keywords=['x']),
+            dataset_row('b', lab='two', keywords=['x'], related_publications=['10.1/b']),
+            dataset_row('c', lab='three')
+        ], require_key=True)
+        created, updated, unchanged = upsert_datasets(rows)
+        self.assertEqual((len(created), updated, unchanged, errors), (3, [], [], []))
+        a, b, c = created
+        # a written row gets a new tuple, even inside the test's transaction
+        before = dict(Dataset.objects.annotate(tuple=RawSQL('ctid::text', [])).values_list('id', 'tuple'))
+
+        rows, errors = validate_rows([
+            dataset_row('a', lab='changed', keywords=['x']),
+            dataset_row('b', lab='two', keywords=['y', 'x'], related_publications=[]),
+            dataset_row('c', lab='three'),
+            dataset_row('d', size=-1.5),
+            dataset_row('e'),
+            dataset_row('e', lab='last')
+        ], require_key=True)
+        created, updated, unchanged = upsert_datasets(rows)
+
+        self.assertEqual([error['index'] for error in errors], [3])
+        self.assertEqual(updated, [a, b])
+        self.assertEqual(unchanged, [c])
+        self.assertEqual(Dataset.objects.get(pk=a).lab, 'changed')
+        self.assertEqual(self.links(b), (['x', 'y'], []))
+        after = dict(Dataset.objects.annotate(tuple=RawSQL('ctid::text', [])).values_list('id', 'tuple'))
+        self.assertEqual(after[c], before[c])
+        self.assertNotEqual(after[a], before[a])
+        self.assertEqual(Dataset.objects.get(pk=created[0]).lab, 'last')
+        self.assertEqual(Dataset.objects.filter(path='e').count(), 1)
+
+    def test_sync_links(self):
+        ids, _ = ingest_rows([dataset_row('a', keywords=['x', 'y']), dataset_row('b', keywords=['x'])])
+        keywords = dict(Keyword.objects.values_list('keyword', 'id'))
+        changed = sync_links(Dataset.keywords.field, {
+            ids[0]: [keywords['y']],
+            ids[1]: [keywords['x']]
+        })
+        self.assertEqual(changed, {ids[0]})
+        self.assertEqual(self.links(ids[0])[0], ['y'])
+
+        changed = sync_links(Dataset.keywords.field, {ids[1]: [keywords['x'], keywords['y']]})
+        self.assertEqual(changed, {ids[1]})
+        self.assertEqual(self.links(ids[1])[0], ['x', 'y'])
+
+
+class FacetCountTests(TestCase):
+    def assertCounted(self):
+        counts = {
+            (facet, value): count
+            for facet, value, count in FacetCount.objects.values_list('facet', 'value', 'count')
+            if count > 0
+        }
+        self.assertEqual(counts, expected_facet_counts())
+        self.assertFalse(FacetCount.objects.filter(count__lte=0).exists())
+
+    def test_counts_follow_datasets(self):
+        ids, _ = ingest_rows([
+            dataset_row('a', lab='one', species='mouse', keywords=['x', 'y']),
+            dataset_row('b', lab='one', species='rat', institution='i', keywords=['x']),
+            dataset_row('c', lab='two', experimenter='e')
+        ])
+        self.assertCounted()
+
+        Dataset.objects.filter(pk=ids[0]).update(lab='two', species=None)
+        Dataset.objects.filter(pk=ids[2]).update(experimenter='f')
+        self.assertCounted()
+
+        a = Dataset.objects.get(pk=ids[0])
+        a.keywords.remove(Keyword.objects.get(keyword='y'))
+        a.keywords.add(Keyword.objects.create(keyword='z'))
+        Dataset.objects.get(pk=ids[1]).keywords.clear()
+        self.assertCounted()
+
+        rows, _ = validate_rows([dataset_row('c', lab='three', keywords=['x', 'z'])], require_key=True)
+        upsert_datasets(rows)
+        self.assertCounted()
+
+        Dataset.objects.filter(pk__in=ids[1:]).delete()
+        self.assertCounted()
+
+        Dataset.objects.all().delete()
+        self.assertCounted()
+        self.assertFalse(FacetCount.objects.exists())
+
+
+class RepresentationTests(TestCase):
+    def test_matches_serializer(self):
+        ingest_rows([
+            dataset_row(
+                'a',
+                keywords=['beta', 'Zeta', 'alpha', 'émile'],
+                related_publications=['10.2/b', '10.1/A', '10.1/a'],
+                age='P3DT2H', date_of_birth='2020-01-02T03:04:05Z', session_start_time='2021-02-03',
+                lab='lab', number_of_units=3
+            ),
+            dataset_row('b', keywords=['alpha']),
+            dataset_row('c')
+        ])
+        queryset = Dataset.objects.order_by('id')
+
+        expected = DatasetSerializer(queryset, many=True).data
+        self.assertEqual([dataset_representation(row) for row in dataset_values(queryset)], expected)
+        self.assertEqual(expected[0]['keywords'], ['Zeta', 'alpha', 'beta', 'émile'])
+
+        fields = select_fields(['id', 'keywords', 'age'])
+        self.assertEqual(
+            [dataset_representation(row, fields) for row in dataset_values(queryset, fields)],
+            [{name: data[name] for name in fields} for data in expected]
+        )
+
+
+class FacetActionTests(TestCase):
+    def test_paged_by_number(self):
+        ingest_rows([
+            dataset_row('a', lab='one', number_of_units=1),
+            dataset_row('b', lab='two', number_of_units=2),
+            dataset_row('c', lab='two', number_of_units=2)
+        ])
+        client = APIClient()
+        # the counted facets are read from FacetCount, the others are aggregated
+        for facet in ['lab', 'units']:
+            response = client.post(
+                '/api/datasets/facet/?page_size=1&page=2', {'facet': facet}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+
+            response = client.post('/api/datasets/facet/?cursor=', {'facet': facet}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class ConditionalGetTests(TransactionTestCase):
+    # every request commits, the catalog version only moves on commits
+    def setUp(self):
+        self.client = APIClient()
+        self.ids, _ = ingest_rows([dataset_row('a', lab='one'), dataset_row('b', lab='two')])
+        self.url = f'/api/datasets/{self.ids[0]}/'
+
+    def assertNotModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response['ETag']
+
+    def test_retrieve(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        self.assertNotModified(self.url, etag)
+
+        fields_etag = self.assertModified(self.url + '?fields=id,lab', etag)
+        self.assertNotModified(self.url + '?fields=id,lab', fields_etag)
+
+        self.client.patch(self.url, {'lab': 'changed'}, format='json')
+        etag = self.assertModified(self.url, etag)
+        self.assertEqual(self.client.get(self.url).json()['lab'], 'changed')
+        self.assertNotModified(self.url, etag)
+
+    def test_list(self):
+        url = '/api/datasets/'
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, etag)
+        self.assertModified(url + '?fields=id', etag)
+        self.assertModified(url + '?query=lab%20%3D%20%22one%22', etag)
+
+        self.client.patch(f'/api/datasets/{self.ids[1]}/', {'lab': 'changed'}, format='json')
+        etag = self.assertModified(url, etag)
+        self.assertNotModified(url, etag)
+
+        # links are part of the catalog too
+        Dataset.objects.get(pk=self.ids[0]).keywords.add(Keyword.objects.create(keyword='x'))
+        self.assertModified(url, etag)
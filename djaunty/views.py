@@ -1,5 +1,8 @@
 from django.shortcuts import get_object_or_404, render
 
+from .conditional import make_etag, not_modified, set_validators
+from .counting import count_queryset
+from .filters import rank_by_relevance
 from .forms import SearchForm, TextSearchForm
 from .models import Dataset
 from .search_parser import SearchParser
@@ -8,13 +11,14 @@ from .serializers import DatasetSerializer
 
 def text_search(request):
     total = 0
+    exact = True
     results = None
     if request.method == 'POST':
         form = TextSearchForm(request.POST)
         if form.is_valid():
             query = form.clean()['search_text']
-            qs = Dataset.objects.filter(search_vector=query)
-            total = qs.count()
+            qs = rank_by_relevance(Dataset.objects.all(), query)
+            total, exact = count_queryset(qs)
             results = DatasetSerializer(qs[:10], many=True).data
     else:
         form = TextSearchForm()
@@ -24,20 +28,22 @@ def text_search(request):
         'form': form.as_table(),
         'results': results,
         'action': 'text',
-        'total': total
+        'total': total,
+        'exact': exact
     }
     return render(request, 'djaunty/search.html', context)
 
 
 def search(request):
     total = 0
+    exact = True
     results = None
     if request.method == 'POST':
         form = SearchForm(request.POST)
         if form.is_valid():
             query = form.clean()['search_text']
             qs = Dataset.objects.filter(query)
-            total = qs.count()
+            total, exact = count_queryset(qs)
             results = DatasetSerializer(qs[:10], many=True).data
     else:
         form = SearchForm()
@@ -47,7 +53,8 @@ def search(request):
         'form': form.as_table(),
         'results': results,
         'action': 'search',
-        'total': total
+        'total': total,
+        'exact': exact
     }
     return render(request, 'djaunty/search.html', context)
 
@@ -59,7 +66,14 @@ def tree(request):
 
 
 def dataset(request, id):
+    updated = get_object_or_404(Dataset.objects.values_list('updated', flat=True), pk=id)
+    etag = make_etag('dataset.html', id, updated.isoformat())
+    response = not_modified(request, etag, updated)
+    if response is not None:
+        return response
+
     dataset = DatasetSerializer(get_object_or_404(Dataset, pk=id)).data
-    return render(request, 'djaunty/dataset.html', {
+    response = render(request, 'djaunty/dataset.html', {
         'dataset': dataset
     })
+    return set_validators(response, etag, updated)